@@ -4,6 +4,7 @@
 from __future__ import absolute_import, division, unicode_literals
 
 import logging
+from functools import wraps
 
 import routing
 
@@ -15,6 +16,18 @@ routing = routing.Plugin()  # pylint: disable=invalid-name
 _LOGGER = logging.getLogger(__name__)
 
 
+def deadline(func):
+    """ Limit the time that the requests of a route can take, including retries. This is only used for the routes that show a listing,
+    since routes like the login wait for the user. The requests of background threads are not limited. """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        """ Run the route with a deadline. """
+        from resources.lib.streamz import util
+        with util.deadline(util.ROUTE_DEADLINE):
+            return func(*args, **kwargs)
+    return wrapper
+
+
 @routing.route('/')
 def index():
     """ Show the profile selection, or go to the main menu. """
@@ -64,6 +77,7 @@ def auth_clear_cache():
 
 
 @routing.route('/catalog/program/<program>')
+@deadline
 def show_catalog_program(program):
     """ Show a program from the catalog """
     from resources.lib.modules.catalog import Catalog
@@ -71,6 +85,7 @@ def show_catalog_program(program):
 
 
 @routing.route('/program/program/<program>/<season>')
+@deadline
 def show_catalog_program_season(program, season):
     """ Show a program from the catalog """
     from resources.lib.modules.catalog import Catalog
@@ -78,6 +93,7 @@ def show_catalog_program_season(program, season):
 
 
 @routing.route('/catalog/recommendations/<storefront>')
+@deadline
 def show_recommendations(storefront):
     """ Shows the recommendations of a storefront """
     from resources.lib.modules.catalog import Catalog
@@ -85,6 +101,7 @@ def show_recommendations(storefront):
 
 
 @routing.route('/catalog/recommendations/<storefront>/<category>')
+@deadline
 def show_recommendations_category(storefront, category):
     """ Show the items in a recommendations category """
     from resources.lib.modules.catalog import Catalog
@@ -92,6 +109,7 @@ def show_recommendations_category(storefront, category):
 
 
 @routing.route('/catalog/mylist')
+@deadline
 def show_mylist():
     """ Show the items in "My List" """
     from resources.lib.modules.catalog import Catalog
@@ -99,6 +117,7 @@ def show_mylist():
 
 
 @routing.route('/catalog/mylist/add/<content_id>')
+@deadline
 def mylist_add(content_id):
     """ Add an item to "My List" """
     from resources.lib.modules.catalog import Catalog
@@ -106,6 +125,7 @@ def mylist_add(content_id):
 
 
 @routing.route('/catalog/mylist/del/<content_id>')
+@deadline
 def mylist_del(content_id):
     """ Remove an item from "My List" """
     from resources.lib.modules.catalog import Catalog
@@ -113,6 +133,7 @@ def mylist_del(content_id):
 
 
 @routing.route('/catalog/continuewatching')
+@deadline
 def show_continuewatching():
     """ Show the items in "Continue Watching" """
     from resources.lib.modules.catalog import Catalog
@@ -136,5 +157,14 @@ def play(category, item):
 
 def run(params):
     """ Run the routing plugin """
+    from resources.lib.streamz.exceptions import NetworkException
     kodilogging.config()
-    routing.run(params)
+    try:
+        routing.run(params)
+    except NetworkException as exc:
+        _LOGGER.error('Could not reach the API: %s', exc)
+        kodiutils.ok_dialog(message=kodiutils.localize(30715))  # Streamz can't be reached right now...
+        kodiutils.end_of_directory()
+    finally:
+        # Routes that only read from the cache also need to save when the items were used
+        kodiutils.flush_cache()
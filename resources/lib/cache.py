@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+"""Key/value cache backed by a single SQLite database"""
+
+from __future__ import absolute_import, division, unicode_literals
+
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from resources.lib import codec
+
+_LOGGER = logging.getLogger(__name__)
+
+SQLITE_MAX_VARIABLES = 500  # Stay below the SQLITE_MAX_VARIABLE_NUMBER of older SQLite versions
+
+MEMORY_MAX_ENTRIES = 512  # Maximum amount of items in the memory cache
+MEMORY_MAX_SIZE = 8 * 1024 * 1024  # Maximum size of the items in the memory cache, based on their serialized size
+
+# How long an item is considered fresh, based on the first part of its key
+TTL_POLICY = {
+    'movie': 24 * 3600,  # 1 day
+    'program': 3600,  # 1 hour, new episodes can be added
+    'season': 30 * 24 * 3600,  # 30 days, the season that is still airing uses a shorter ttl
+    'storefront': 15 * 60,  # 15 minutes
+    'swimlane': 5 * 60,  # 5 minutes, this contains My List
+}
+NO_EXPIRY = 0  # Use as ttl to accept an item regardless of its age
+
+EVICTION_INTERVAL = 100  # Amount of writes between two checks of the size of the database
+EVICTION_BATCH = 50  # Maximum amount of items that are evicted at once, so a write never blocks for long
+
+
+class MemoryCache:
+    """ A bounded in-memory LRU cache.
+
+    Kodi keeps the interpreter alive between invocations when reuselanguageinvoker is enabled, so the items survive between routes.
+    When the interpreter is not reused, the cache just starts empty. The stored items are shared, so they should not be modified.
+    """
+
+    def __init__(self, max_entries=MEMORY_MAX_ENTRIES, max_size=MEMORY_MAX_SIZE):
+        """ Initialise object
+
+        :param int max_entries:         The maximum amount of items.
+        :param int max_size:            The maximum total size of the items.
+        """
+        self._max_entries = max_entries
+        self._max_size = max_size
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Get an item and mark it as most recently used.
+
+        :type key: str
+        :returns:                       The stored item, or None when it isn't available.
+        """
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is None:
+                return None
+            self._items[key] = item
+            return item[0]
+
+    def set(self, key, data, size):
+        """ Store an item, and evict the least recently used items when we are over our limits.
+
+        :type key: str
+        :param data:                    The item to store.
+        :param int size:                The size of the item.
+        """
+        with self._lock:
+            self._discard(key)
+            if size > self._max_size:
+                return
+            self._items[key] = (data, size)
+            self._size += size
+            while len(self._items) > self._max_entries or self._size > self._max_size:
+                self._discard(next(iter(self._items)))
+
+    def delete(self, key):
+        """ Remove an item.
+
+        :type key: str
+        """
+        with self._lock:
+            self._discard(key)
+
+    def clear(self):
+        """ Remove all items. """
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+    def _discard(self, key):
+        """ Remove an item, the lock should already be acquired.
+
+        :type key: str
+        """
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._size -= item[1]
+
+
+class CacheStore:
+    """ A key/value store with expiry times in a single SQLite database, with a memory cache in front of it """
+
+    SCHEMA_VERSION = 4
+
+    def __init__(self, path, memory=None, max_size=None, ttl_policy=None):
+        """ Initialise object
+
+        :param str path:                The path of the database file.
+        :param MemoryCache memory:      The memory cache to use in front of the database.
+        :param int max_size:            The size budget of the items in the database. The least recently used items are evicted when we are over it.
+        :param dict ttl_policy:         Overrides for the ttl of a namespace in TTL_POLICY.
+        """
+        self._path = path
+        self._ttl_policy = dict(TTL_POLICY, **(ttl_policy or {}))
+        self._local = threading.local()
+        self._memory = memory if memory is not None else MemoryCache()
+        self._max_size = max_size
+        self._accessed = {}  # Access times that still need to be written to the database
+        self._accessed_lock = threading.Lock()
+        self._writes = EVICTION_INTERVAL  # Check the size on the first write
+
+    def _connection(self):
+        """ Return the connection for the current thread, SQLite connections can't be shared between threads.
+
+        :rtype: sqlite3.Connection
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=10, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._setup(connection)
+            self._local.connection = connection
+        return connection
+
+    def _setup(self, connection):
+        """ Create the schema. Since this is only a cache, an outdated schema is just dropped.
+
+        :type connection: sqlite3.Connection
+        """
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        if version == self.SCHEMA_VERSION:
+            return
+
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+
+            # Another thread could have created the schema while we waited for the lock
+            version = connection.execute('PRAGMA user_version').fetchone()[0]
+            if version == self.SCHEMA_VERSION:
+                return
+
+            _LOGGER.debug('Creating cache database %s (version %s)', self._path, self.SCHEMA_VERSION)
+            connection.execute('DROP TABLE IF EXISTS cache')
+            connection.execute('CREATE TABLE cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, updated REAL NOT NULL, '
+                               'expires REAL, accessed REAL NOT NULL, validators TEXT)')
+            connection.execute('CREATE INDEX cache_updated ON cache (updated)')
+            connection.execute('CREATE INDEX cache_accessed ON cache (accessed)')
+            connection.execute('PRAGMA user_version=%d' % self.SCHEMA_VERSION)
+
+    @staticmethod
+    def _is_valid(updated, expires, now, ttl):
+        """ Check if an item is not expired.
+
+        :type updated: float
+        :type expires: float
+        :type now: float
+        :type ttl: int
+        :rtype: bool
+        """
+        if expires is not None and expires < now:
+            return False
+        if ttl and now - updated > ttl:
+            return False
+        return True
+
+    def _get_ttl(self, key, ttl):
+        """ Return the ttl to use for a key. The ttl of the namespace is used when no ttl is specified.
+
+        :type key: str
+        :type ttl: int|None
+        :rtype: int|None
+        """
+        if ttl is not None:
+            return ttl
+        return self._ttl_policy.get(key.split('.', 1)[0])
+
+    def get(self, key, ttl=None):
+        """ Get an item from the cache.
+
+        :param str key:                 The key of the item.
+        :param int ttl:                 Ignore the item when it is older than this amount of seconds. Defaults to the ttl of the namespace.
+        :returns:                       The stored item, or None when it isn't available.
+        """
+        return self.get_entry(key, ttl=ttl)[0]
+
+    def get_entry(self, key, ttl=None, max_stale=0):
+        """ Get an item from the cache, and also accept it when it has expired recently.
+
+        :param str key:                 The key of the item.
+        :param int ttl:                 The item is expired when it is older than this amount of seconds. Defaults to the ttl of the namespace.
+        :param int max_stale:           Also return the item when it has expired less than this amount of seconds ago.
+        :returns:                       A tuple with the stored item (or None when it isn't available), and a boolean that indicates if it is fresh.
+        :rtype: tuple[any, bool]
+        """
+        now = time.time()
+        ttl = self._get_ttl(key, ttl)
+        stale_ttl = ttl + max_stale if ttl and max_stale else ttl
+
+        item = self._memory.get(key)
+        if item is not None:
+            data, updated, expires = item
+        else:
+            row = self._connection().execute('SELECT value, updated, expires FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None, False
+            value, updated, expires = row
+            try:
+                data = codec.loads(value)
+            except ValueError:
+                return None, False
+            self._memory.set(key, (data, updated, expires), len(value))
+
+        if not self._is_valid(updated, expires, now, stale_ttl):
+            return None, False
+        with self._accessed_lock:
+            self._accessed[key] = now
+        return data, self._is_valid(updated, expires, now, ttl)
+
+    def get_many(self, keys, ttl=None):
+        """ Get multiple items from the cache in bulk.
+
+        :param list[str] keys:          The keys of the items.
+        :param int ttl:                 Ignore the items that are older than this amount of seconds. Defaults to the ttl of the namespace.
+        :returns:                       A dictionary with the items that are available.
+        :rtype: dict
+        """
+        now = time.time()
+        result = {}
+        missing = []
+        for key in keys:
+            item = self._memory.get(key)
+            if item is None:
+                missing.append(key)
+            elif self._is_valid(item[1], item[2], now, self._get_ttl(key, ttl)):
+                result[key] = item[0]
+
+        for offset in range(0, len(missing), SQLITE_MAX_VARIABLES):
+            chunk = missing[offset:offset + SQLITE_MAX_VARIABLES]
+            rows = self._connection().execute('SELECT key, value, updated, expires FROM cache WHERE key IN (%s)' % ','.join('?' * len(chunk)), chunk)
+            for key, value, updated, expires in rows:
+                if not self._is_valid(updated, expires, now, self._get_ttl(key, ttl)):
+                    continue
+                try:
+                    result[key] = codec.loads(value)
+                except ValueError:
+                    continue
+                self._memory.set(key, (result[key], updated, expires), len(value))
+
+        with self._accessed_lock:
+            self._accessed.update((key, now) for key in result)
+        return result
+
+    def get_validators(self, key):
+        """ Get an item from the cache regardless of its age, together with the validators of the response it came from.
+
+        :param str key:                 The key of the item.
+        :returns:                       A tuple with the stored item and its validators, or (None, None) when it isn't available.
+        :rtype: tuple[any, dict]
+        """
+        row = self._connection().execute('SELECT value, validators FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] is None:
+            return None, None
+        try:
+            return codec.loads(row[0]), codec.loads(row[1])
+        except ValueError:
+            return None, None
+
+    def touch(self, key, ttl=None):
+        """ Mark an item as fresh again without rewriting it, e.g. when the server told us it hasn't changed.
+
+        :param str key:                 The key of the item.
+        :param int ttl:                 Expire the item after this amount of seconds.
+        """
+        now = time.time()
+        self._connection().execute('UPDATE cache SET updated = ?, expires = ?, accessed = ? WHERE key = ?', (now, now + ttl if ttl else None, now, key))
+        self._memory.delete(key)
+
+    def set(self, key, data, ttl=None, validators=None):
+        """ Store an item in the cache. Storing None removes the item.
+
+        :param str key:                 The key of the item.
+        :param data:                    The item to store, this needs to be serializable to JSON.
+        :param int ttl:                 Expire the item after this amount of seconds.
+        :param dict validators:         The ETag and Last-Modified validators of the response the item came from.
+        """
+        self.set_many({key: data}, ttl=ttl, validators={key: validators} if validators else None)
+
+    def set_many(self, items, ttl=None, validators=None):
+        """ Store multiple items in the cache in one transaction. Items with a value of None are removed.
+
+        :param dict items:              The items to store.
+        :param int ttl:                 Expire the items after this amount of seconds.
+        :param dict validators:         The validators of the items, indexed by their key.
+        """
+        validators = validators or {}
+        now = time.time()
+        expires = now + ttl if ttl else None
+        rows = []
+        for key, data in items.items():
+            if data is None:
+                self._memory.delete(key)
+                continue
+            value = codec.dumps(data)
+            self._memory.set(key, (data, now, expires), len(value))
+            rows.append((key, value, len(value), now, expires, now, codec.dumps(validators[key]) if validators.get(key) else None))
+
+        # The pending access times are written in the same transaction, since we are writing anyway
+        accessed = self._take_accessed()
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN')
+            connection.executemany('UPDATE cache SET accessed = ? WHERE key = ?', [(when, key) for key, when in accessed.items()])
+            connection.executemany('DELETE FROM cache WHERE key = ?', [(key,) for key, data in items.items() if data is None])
+            connection.executemany('INSERT OR REPLACE INTO cache (key, value, size, updated, expires, accessed, validators) VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+
+        self._writes += len(rows)
+        if self._writes >= EVICTION_INTERVAL:
+            self._writes = 0
+            self.evict()
+
+    def evict(self):
+        """ Evict the least recently used items when the database is over its size budget.
+        Only a batch of items is evicted at once, the rest is evicted on the next writes. """
+        if not self._max_size:
+            return
+
+        connection = self._connection()
+        self.flush()
+
+        excess = connection.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0] - self._max_size
+        if excess <= 0:
+            return
+
+        evict = []
+        for key, size in connection.execute('SELECT key, size FROM cache ORDER BY accessed LIMIT ?', (EVICTION_BATCH,)).fetchall():
+            if excess <= 0:
+                break
+            evict.append(key)
+            excess -= size
+
+        _LOGGER.debug('Evicting %d items from the cache', len(evict))
+        with connection:
+            connection.execute('BEGIN')
+            connection.executemany('DELETE FROM cache WHERE key = ?', [(key,) for key in evict])
+        for key in evict:
+            self._memory.delete(key)
+
+        if excess > 0:
+            # Continue on the next write
+            self._writes = EVICTION_INTERVAL
+
+    def _take_accessed(self):
+        """ Return the access times that still need to be written to the database, and start collecting new ones.
+
+        :rtype: dict[str, float]
+        """
+        with self._accessed_lock:
+            accessed, self._accessed = self._accessed, {}
+        return accessed
+
+    def flush(self):
+        """ Write the access times to the database. We collect them in memory, so a read doesn't need a write. They are also written
+        with the next write, but a route that only reads needs to flush them when it ends. """
+        accessed = self._take_accessed()
+        if accessed:
+            connection = self._connection()
+            with connection:
+                connection.execute('BEGIN')
+                connection.executemany('UPDATE cache SET accessed = ? WHERE key = ?', [(when, key) for key, when in accessed.items()])
+
+    def invalidate(self, ttl=None):
+        """ Remove items from the cache.
+
+        :param int ttl:                 Only remove the items that are older than this amount of seconds. All items are removed when not specified.
+        """
+        self._memory.clear()
+        connection = self._connection()
+        if ttl:
+            self.flush()
+            connection.execute('DELETE FROM cache WHERE updated < ?', (time.time() - ttl,))
+        else:
+            self._take_accessed()
+            connection.execute('DELETE FROM cache')
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""JSON encoding and decoding, using a faster library when one is available"""
+
+from __future__ import absolute_import, division, unicode_literals
+
+try:  # orjson is the fastest, but isn't available everywhere
+    import orjson
+
+    NAME = 'orjson'
+
+    def loads(data):
+        """ Parse a JSON document.
+
+        :param bytes|str data:          The JSON document. Bytes are parsed directly, without decoding them to text first.
+        """
+        return orjson.loads(data)  # pylint: disable=no-member
+
+    def dumps(data):
+        """ Serialize data to a compact JSON document.
+
+        :rtype: str
+        """
+        return orjson.dumps(data).decode('utf-8')  # pylint: disable=no-member
+
+except ImportError:
+    try:
+        import ujson
+
+        NAME = 'ujson'
+
+        def loads(data):
+            """ Parse a JSON document.
+
+            :param bytes|str data:          The JSON document. Bytes are parsed directly, without decoding them to text first.
+            """
+            return ujson.loads(data)
+
+        def dumps(data):
+            """ Serialize data to a compact JSON document.
+
+            :rtype: str
+            """
+            return ujson.dumps(data, ensure_ascii=False)
+
+    except ImportError:
+        import json
+
+        NAME = 'json'
+
+        def loads(data):
+            """ Parse a JSON document.
+
+            :param bytes|str data:          The JSON document. Bytes are decoded to text first, since json only accepts them from
+                                            Python 3.6 on.
+            """
+            if isinstance(data, bytes):
+                data = data.decode('utf-8')
+            return json.loads(data)
+
+        def dumps(data):
+            """ Serialize data to a compact JSON document.
+
+            :rtype: str
+            """
+            return json.dumps(data, separators=(',', ':'))
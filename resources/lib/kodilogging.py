@@ -51,6 +51,17 @@ class KodiLogHandler(logging.StreamHandler):
         """ Flush the messages """
 
 
+def is_debug_enabled():
+    """ Check if debug messages end up in the Kodi log. This is the case when debug logging is enabled in Kodi, or in the add-on settings.
+    Use this to skip expensive work for debug messages, since our logger passes all messages and Kodi only filters them afterwards.
+
+    :rtype: bool
+    """
+    if ADDON.getSetting('debug_logging') == 'true':
+        return True
+    return bool(xbmc.getCondVisibility('System.GetBool(debug.showloginfo)'))
+
+
 def config():
     """ Setup the logger with this handler """
     logger = logging.getLogger()
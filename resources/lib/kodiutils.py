@@ -644,71 +644,105 @@ def exists(path):
     return xbmcvfs.exists(path)
 
 
+def get_cache_store():
+    """Cache and return the cache database"""
+    if not hasattr(get_cache_store, 'cached'):
+        from resources.lib.cache import CacheStore
+
+        fullpath = get_cache_path() + '/'
+        if not xbmcvfs.exists(fullpath):
+            xbmcvfs.mkdirs(fullpath)
+
+        database = os.path.join(fullpath, 'cache.sqlite')
+        if not xbmcvfs.exists(database):
+            # Remove the files of the old cache that used one file per key
+            _, files = xbmcvfs.listdir(fullpath)
+            for filename in files:
+                xbmcvfs.delete(os.path.join(fullpath, filename))
+
+        get_cache_store.cached = CacheStore(database, max_size=get_setting_int('cache_size', 50) * 1024 * 1024)
+    return getattr(get_cache_store, 'cached')
+
+
 def get_cache(key, ttl=None):
-    """ Get an item from the cache
+    """ Get an item from the cache. The ttl defaults to the ttl of the namespace in the cache policy, use NO_EXPIRY to ignore the age.
     :type key: list[str]
     :type ttl: int
     """
-    import time
+    value = get_cache_store().get('.'.join(key), ttl=ttl)
+    if value is not None:
+        _LOGGER.debug('Fetching %s from cache', '.'.join(key))
+    return value
 
-    fullpath = os.path.join(get_cache_path(), '.'.join(key))
-    if not xbmcvfs.exists(fullpath):
-        return None
 
-    if ttl and time.mktime(time.localtime()) - xbmcvfs.Stat(fullpath).st_mtime() > ttl:
-        return None
+def get_cache_entry(key, ttl=None, max_stale=0):
+    """ Get an item from the cache, and also accept it when it has expired less than max_stale seconds ago
+    :type key: list[str]
+    :type ttl: int
+    :type max_stale: int
+    :returns: A tuple with the item (or None), and a boolean that indicates if the item is fresh.
+    :rtype: tuple[any, bool]
+    """
+    return get_cache_store().get_entry('.'.join(key), ttl=ttl, max_stale=max_stale)
 
-    fdesc = xbmcvfs.File(fullpath, 'r')
 
-    import json
-    try:
-        value = json.load(fdesc)
-        fdesc.close()
-        _LOGGER.debug('Fetching %s from cache', fullpath)
-        return value
-    except (ValueError, TypeError):
-        return None
+def get_cache_many(keys, ttl=None):
+    """ Get multiple items from the cache with one lookup
+    :type keys: list[list[str]]
+    :type ttl: int
+    :returns: A dictionary with the items that are available, indexed by their key as a tuple.
+    :rtype: dict[tuple, any]
+    """
+    values = get_cache_store().get_many(['.'.join(key) for key in keys], ttl=ttl)
+    return {tuple(key): values['.'.join(key)] for key in keys if '.'.join(key) in values}
 
 
-def set_cache(key, data):
+def get_cache_validators(key):
+    """ Get an item from the cache regardless of its age, together with the validators to revalidate it with the API
+    :type key: list[str]
+    :returns: A tuple with the item and its validators, or (None, None) when the item has no validators.
+    :rtype: tuple[any, dict]
+    """
+    return get_cache_store().get_validators('.'.join(key))
+
+
+def set_cache(key, data, ttl=None, validators=None):
     """ Store an item in the cache
     :type key: list[str]
     :type data: any
+    :type ttl: int
+    :type validators: dict
     """
-    fullpath = get_cache_path() + '/'
-    if not xbmcvfs.exists(fullpath):
-        xbmcvfs.mkdirs(fullpath)
-
-    fullpath = os.path.join(fullpath, '.'.join(key))
+    _LOGGER.debug('Storing to cache as %s', '.'.join(key))
+    get_cache_store().set('.'.join(key), data, ttl=ttl, validators=validators)
 
-    if data is None:
-        # Remove from cache
-        xbmcvfs.delete(fullpath)
-        return
 
-    fdesc = xbmcvfs.File(fullpath, 'w')
+def touch_cache(key, ttl=None):
+    """ Mark an item in the cache as fresh again
+    :type key: list[str]
+    :type ttl: int
+    """
+    _LOGGER.debug('Revalidated %s in cache', '.'.join(key))
+    get_cache_store().touch('.'.join(key), ttl=ttl)
 
-    import json
-    _LOGGER.debug('Storing to cache as %s', fullpath)
-    json.dump(data, fdesc)
 
-    fdesc.close()
+def set_cache_many(items, ttl=None):
+    """ Store multiple items in the cache with one transaction
+    :type items: list[tuple[list[str], any]]
+    :type ttl: int
+    """
+    get_cache_store().set_many({'.'.join(key): data for key, data in items}, ttl=ttl)
 
 
 def invalidate_cache(ttl=None):
     """ Clear the cache """
-    fullpath = get_cache_path() + '/'
-    if not xbmcvfs.exists(fullpath):
-        return
-
-    _, files = xbmcvfs.listdir(fullpath)
-    import time
-    now = time.mktime(time.localtime())
-    for filename in files:
-        filepath = os.path.join(fullpath, filename)
-        if ttl and now - xbmcvfs.Stat(filepath).st_mtime() < ttl:
-            continue
-        xbmcvfs.delete(filepath)
+    get_cache_store().invalidate(ttl=ttl)
+
+
+def flush_cache():
+    """ Write the pending access times of the cache, when the cache was used """
+    if hasattr(get_cache_store, 'cached'):
+        get_cache_store().flush()
 
 
 def notify(sender, message, data):
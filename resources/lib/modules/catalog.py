@@ -8,7 +8,8 @@ import logging
 from resources.lib import kodiutils
 from resources.lib.kodiutils import TitleItem
 from resources.lib.modules.menu import Menu
-from resources.lib.streamz import STOREFRONT_MAIN, STOREFRONT_MOVIES, STOREFRONT_PAGE_CONTINUE_WATCHING, STOREFRONT_SERIES, Category
+from resources.lib.streamz import (API_ENDPOINT, STOREFRONT_MAIN, STOREFRONT_MOVIES, STOREFRONT_PAGE_CONTINUE_WATCHING, STOREFRONT_SERIES,
+                                   VIDEOPLAYER_ENDPOINT, Category, util)
 from resources.lib.streamz.api import CACHE_PREVENT, Api
 from resources.lib.streamz.auth import Auth
 from resources.lib.streamz.exceptions import UnavailableException
@@ -22,7 +23,7 @@ class Catalog:
     def __init__(self):
         """ Initialise object """
         auth = Auth(kodiutils.get_tokens_path())
-        self._api = Api(auth.get_tokens())
+        self._api = Api(auth.get_tokens(), hydrate=kodiutils.get_setting_bool('interface_fetch_details', default=False))
 
     def show_program(self, program):
         """ Show a program from the catalog.
@@ -30,7 +31,7 @@ class Catalog:
         :type program: str
          """
         try:
-            program_obj = self._api.get_program(program, cache=CACHE_PREVENT)  # Use CACHE_PREVENT since we want fresh data
+            program_obj = self._api.get_program(program)  # The cache policy makes sure we get fresh data, closed seasons are reused
         except UnavailableException:
             kodiutils.ok_dialog(message=kodiutils.localize(30712))  # The video is unavailable and can't be played right now.
             kodiutils.end_of_directory()
@@ -38,7 +39,7 @@ class Catalog:
 
         # Go directly to the season when we have only one season
         if len(program_obj.seasons) == 1:
-            self.show_program_season(program, list(program_obj.seasons.values())[0].number)
+            self.show_program_season(program, int(list(program_obj.seasons.keys())[0]))
             return
 
         # studio = CHANNELS.get(program_obj.channel, {}).get('studio_icon')
@@ -67,11 +68,11 @@ class Catalog:
                 ),
             ))
 
-        # Add the seasons
-        for season in list(program_obj.seasons.values()):
+        # Add the seasons, we only need the season numbers here, so we don't load the seasons themselves
+        for season in [int(season) for season in program_obj.seasons.keys()]:
             listing.append(TitleItem(
-                title=kodiutils.localize(30205, season=season.number),  # Season {season}
-                path=kodiutils.url_for('show_catalog_program_season', program=program, season=season.number),
+                title=kodiutils.localize(30205, season=season),  # Season {season}
+                path=kodiutils.url_for('show_catalog_program_season', program=program, season=season),
                 art_dict=dict(
                     poster=program_obj.poster,
                     thumb=program_obj.thumb,
@@ -81,7 +82,7 @@ class Catalog:
                 info_dict=dict(
                     mediatype='season',
                     tvshowtitle=program_obj.name,
-                    title=kodiutils.localize(30205, season=season.number),  # Season {season}
+                    title=kodiutils.localize(30205, season=season),  # Season {season}
                     tagline=program_obj.description,
                     set=program_obj.name,
                     # studio=studio,
@@ -91,6 +92,7 @@ class Catalog:
 
         # Sort by label. Some programs return seasons unordered.
         kodiutils.show_listing(listing, program_obj.name, content='tvshows', sort=['label'])
+        self._notify_offline()
 
     def show_program_season(self, program, season):
         """ Show the episodes of a program from the catalog.
@@ -99,7 +101,7 @@ class Catalog:
         :type season: int
         """
         try:
-            program_obj = self._api.get_program(program)  # Use CACHE_AUTO since the data is just refreshed in show_program
+            program_obj = self._api.get_program(program)
         except UnavailableException:
             kodiutils.ok_dialog(message=kodiutils.localize(30712))  # The video is unavailable and can't be played right now.
             kodiutils.end_of_directory()
@@ -116,6 +118,8 @@ class Catalog:
 
         # Sort by episode number by default. Takes seasons into account.
         kodiutils.show_listing(listing, program_obj.name, content='episodes', sort=['episode', 'duration'])
+        self._notify_offline()
+        self._prewarm()
 
     def show_recommendations(self, storefront):
         """ Show the recommendations.
@@ -147,6 +151,7 @@ class Catalog:
             label = 30015  # Recommendations
 
         kodiutils.show_listing(listing, label, content='files')
+        self._notify_offline()
 
     def show_recommendations_category(self, storefront, category):
         """ Show the items in a recommendations category.
@@ -170,6 +175,8 @@ class Catalog:
             content = 'tvshows'  # Fallback to a list of tvshows
 
         kodiutils.show_listing(listing, result.title, content=content, sort=['unsorted', 'label', 'year', 'duration'])
+        self._notify_offline()
+        self._prewarm()
 
     def show_mylist(self):
         """ Show the items in "My List". """
@@ -182,6 +189,8 @@ class Catalog:
 
         # Sort categories by default like in Streamz.
         kodiutils.show_listing(listing, 30017, content='files', sort=['unsorted', 'label', 'year', 'duration'])
+        self._notify_offline()
+        self._prewarm()
 
     def mylist_add(self, content_id):
         """ Add an item to "My List".
@@ -201,7 +210,8 @@ class Catalog:
 
     def show_continuewatching(self):
         """ Show the items in "Continue Watching". """
-        category = self._api.get_storefront_category(STOREFRONT_MAIN, STOREFRONT_PAGE_CONTINUE_WATCHING)
+        # Use CACHE_PREVENT since the progress changes every time something is played
+        category = self._api.get_storefront_category(STOREFRONT_MAIN, STOREFRONT_PAGE_CONTINUE_WATCHING, cache=CACHE_PREVENT)
 
         listing = []
         for item in category.content:
@@ -216,3 +226,16 @@ class Catalog:
 
         # Sort categories by default like in Streamz.
         kodiutils.show_listing(listing, 30019, content='episodes', sort='label')
+        self._notify_offline()
+        self._prewarm()
+
+    def _notify_offline(self):
+        """ Let the user know that we are showing cached content, since the API couldn't be reached. """
+        if self._api.offline:
+            kodiutils.notification(message=kodiutils.localize(30714))  # Streamz can't be reached. You are browsing...
+
+    def _prewarm(self):
+        """ Connect to the playback services while the user picks something to play from a listing. Kodi reuses the interpreter, so
+        the connections are still in the pool when the stream is requested. """
+        if not self._api.offline and kodiutils.get_setting_bool('network_prewarm', default=True):
+            util.prewarm([API_ENDPOINT, VIDEOPLAYER_ENDPOINT])
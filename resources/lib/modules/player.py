@@ -7,6 +7,7 @@ import logging
 
 from resources.lib import kodiutils
 from resources.lib.kodiplayer import KodiPlayer
+from resources.lib.streamz import API_ENDPOINT, VIDEOPLAYER_ENDPOINT, util
 from resources.lib.streamz.api import Api
 from resources.lib.streamz.auth import Auth
 from resources.lib.streamz.exceptions import LimitReachedException, UnavailableException
@@ -30,6 +31,10 @@ class Player:
         :type category: string
         :type item: string
         """
+        # Connect to the playback services while we check inputstreamhelper
+        if kodiutils.get_setting_bool('network_prewarm', default=True):
+            util.prewarm([API_ENDPOINT, VIDEOPLAYER_ENDPOINT])
+
         # Check if inputstreamhelper is correctly installed
         if not self._check_inputstream():
             kodiutils.end_of_directory()
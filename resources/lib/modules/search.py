@@ -7,8 +7,10 @@ import logging
 
 from resources.lib import kodiutils
 from resources.lib.modules.menu import Menu
+from resources.lib.streamz import util
 from resources.lib.streamz.api import Api
 from resources.lib.streamz.auth import Auth
+from resources.lib.streamz.exceptions import NetworkException
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -19,7 +21,7 @@ class Search:
     def __init__(self,):
         """ Initialise object """
         auth = Auth(kodiutils.get_tokens_path())
-        self._api = Api(auth.get_tokens())
+        self._api = Api(auth.get_tokens(), hydrate=kodiutils.get_setting_bool('interface_fetch_details', default=False))
 
     def show_search(self, query=None):
         """ Shows the search dialog.
@@ -33,9 +35,14 @@ class Search:
                 kodiutils.end_of_directory()
                 return
 
-        # Do search
+        # Do search, the time the user needed to enter the query doesn't count
         try:
-            items = self._api.do_search(query)
+            with util.deadline(util.ROUTE_DEADLINE):
+                items = self._api.do_search(query)
+        except NetworkException:
+            kodiutils.notification(message=kodiutils.localize(30715))  # Streamz can't be reached right now...
+            kodiutils.end_of_directory()
+            return
         except Exception as ex:  # pylint: disable=broad-except
             kodiutils.notification(message=str(ex))
             kodiutils.end_of_directory()
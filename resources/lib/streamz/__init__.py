@@ -3,8 +3,22 @@
 
 from __future__ import absolute_import, division, unicode_literals
 
+import os.path
+import re
+import zlib
+from bisect import bisect_left, bisect_right
+
+from resources.lib.streamz.exceptions import NetworkException
+
+try:  # Python 3
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping  # pylint: disable=deprecated-class
+
 API_ENDPOINT = 'https://lfvp-api.dpgmedia.net'
 API_ANDROID_ENDPOINT = 'https://lfvp-android-api.dpgmedia.net'
+LOGIN_ENDPOINT = 'https://login.streamz.be'
+VIDEOPLAYER_ENDPOINT = 'https://videoplayer-service.api.persgroep.cloud'
 
 # These seem to be hardcoded
 STOREFRONT_MAIN = 'main'
@@ -18,8 +32,87 @@ STOREFRONT_PAGE_CONTINUE_WATCHING = '7574469c-5d78-4878-84f5-c5729442eee4'
 PRODUCT_STREAMZ = 'STREAMZ'
 PRODUCT_STREAMZ_KIDS = 'STREAMZ_KIDS'
 
-class Profile:
+# The format of the snapshots of the models in the cache. Increase this when a snapshot changes in another way than the slots of a model.
+SNAPSHOT_FORMAT = 1
+
+# Values that are shared by many objects, like the channel and the legal icons. Every value is only kept once in memory.
+_INTERNED = {}
+
+# The channel of a channel logo url
+_CHANNELS = {}
+
+# Episode names can start with the episode number, like "1. Pilot"
+_EPISODE_PREFIX = re.compile(r'^(\d+). ')
+
+
+def _intern(value):
+    """ Return the shared instance of a value.
+
+    :type value: str|tuple|None
+    :rtype: str|tuple|None
+    """
+    if value is None:
+        return None
+    return _INTERNED.setdefault(value, value)
+
+
+def parse_channel(url):
+    """ Parse the channel logo url, and return an icon that matches resource.images.studios.white
+
+    :type url: str
+    :rtype: str|None
+    """
+    if not url:
+        return None
+
+    if url not in _CHANNELS:
+        # The channels id's we use in resources.lib.modules.CHANNELS neatly matches this part in the url.
+        _CHANNELS[url] = _intern(str(os.path.basename(url).split('-')[0]))
+    return _CHANNELS[url]
+
+
+def parse_legal(legal):
+    """ Return the legal icons as a shared tuple.
+
+    :type legal: list[str]|None
+    :rtype: tuple[str]|None
+    """
+    return _intern(tuple(legal)) if legal is not None else None
+
+
+class _Model:
+    """ Base class of the models. The attributes are kept in slots, since we can build a lot of episodes. """
+    __slots__ = ()
+
+    def to_snapshot(self):
+        """ Return the attributes as a list in the order of the slots, so the model can be cached and restored without mapping it again.
+
+        :rtype: list
+        """
+        return [getattr(self, key) for key in self.__slots__]
+
+    @classmethod
+    def from_snapshot(cls, values):
+        """ Restore a model from a snapshot.
+
+        :param list values:             The snapshot, as returned by to_snapshot().
+        """
+        obj = cls.__new__(cls)
+        for key, value in zip(cls.__slots__, values):
+            if key == 'legal':
+                value = parse_legal(value)
+            elif key == 'channel':
+                value = _intern(value)
+            setattr(obj, key, value)
+        return obj
+
+    def __repr__(self):
+        return "%r" % {key: getattr(self, key) for key in self.__slots__ if not key.startswith('_')}
+
+
+class Profile(_Model):
     """ Defines a profile under your account. """
+    __slots__ = ('key', 'name', 'gender', 'birthdate', 'color', 'color2', 'main_profile', 'kids_profile')
 
     def __init__(self, key=None, name=None, gender=None, birthdate=None, color=None, color2=None, main_profile=None, kids_profile=None):
         """
@@ -41,12 +134,29 @@ class Profile:
         self.main_profile = main_profile
         self.kids_profile = kids_profile
 
-    def __repr__(self):
-        return "%r" % self.__dict__
-
+    @classmethod
+    def from_api_json(cls, data):
+        """ Create a Profile from the json of the API.
 
-class Category:
+        :type data: dict
+        :rtype: Profile
+        """
+        color = data.get('color') or {}
+        return cls(
+            key=data.get('id'),
+            name=data.get('name'),
+            gender=data.get('gender'),
+            birthdate=data.get('birthDate'),
+            color=color.get('start'),
+            color2=color.get('end'),
+            main_profile=data.get('mainProfile'),
+            kids_profile=data.get('kidsProfile'),
+        )
+
+
+class Category(_Model):
     """ Defines a category from the catalog """
+    __slots__ = ('category_id', 'title', 'content')
 
     def __init__(self, category_id=None, title=None, content=None):
         """
@@ -58,12 +168,21 @@ class Category:
         self.title = title
         self.content = content
 
-    def __repr__(self):
-        return "%r" % self.__dict__
+    @classmethod
+    def from_api_json(cls, data, content=None):
+        """ Create a Category from the json of a storefront row.
 
+        :type data: dict
+        :type content: list[Union[Movie, Program, Episode]]
+        :rtype: Category
+        """
+        return cls(category_id=data.get('id'), title=data.get('title'), content=content)
 
-class Movie:
+
+class Movie(_Model):
     """ Defines a Movie """
+    __slots__ = ('movie_id', 'name', 'description', 'year', 'poster', 'thumb', 'fanart', 'duration', 'remaining', 'geoblocked', 'channel',
+                 'legal', 'aired', 'my_list', 'available')
 
     def __init__(self, movie_id=None, name=None, description=None, year=None, poster=None, thumb=None, fanart=None, duration=None,
                  remaining=None, geoblocked=None, channel=None, legal=None, aired=None, my_list=None, available=True):
@@ -79,7 +198,7 @@ class Movie:
         :type remaining: str
         :type geoblocked: bool
         :type channel: Optional[str]
-        :type legal: str
+        :type legal: tuple[str]
         :type aired: str
         :type my_list: bool
         :type available: bool
@@ -100,12 +219,37 @@ class Movie:
         self.my_list = my_list
         self.available = available
 
-    def __repr__(self):
-        return "%r" % self.__dict__
-
+    @classmethod
+    def from_api_json(cls, data):
+        """ Create a Movie from the json of the details of a movie.
 
-class Program:
+        :type data: dict
+        :rtype: Movie
+        """
+        blocked_for = data.get('blockedFor')
+        return cls(
+            movie_id=data.get('id'),
+            name=data.get('name'),
+            description=data.get('description'),
+            duration=data.get('durationSeconds'),
+            poster=data.get('portraitTeaserImageUrl'),
+            thumb=data.get('landscapeTeaserImageUrl'),
+            fanart=data.get('backgroundImageUrl'),
+            year=data.get('productionYear'),
+            geoblocked=blocked_for == 'GEO',
+            remaining=data.get('remainingDaysAvailable'),
+            legal=parse_legal(data.get('legalIcons')),
+            # aired=data.get('broadcastTimestamp'),
+            channel=parse_channel(data.get('channelLogoUrl')),
+            # my_list=data.get('addedToMyList'),  # Don't use addedToMyList, since we might have cached this info
+            available=blocked_for != 'SUBSCRIPTION',
+        )
+
+
+class Program(_Model):
     """ Defines a Program """
+    __slots__ = ('program_id', 'name', 'description', 'poster', 'thumb', 'fanart', 'seasons', 'geoblocked', 'channel', 'legal', 'my_list',
+                 'available', '_index')
 
     def __init__(self, program_id=None, name=None, description=None, poster=None, thumb=None, fanart=None, seasons=None,
                  geoblocked=None, channel=None, legal=None, my_list=None, available=True):
@@ -116,10 +260,10 @@ class Program:
         :type poster: str
         :type thumb: str
         :type fanart: str
-        :type seasons: dict[int, Season]
+        :type seasons: dict[int, Season]|LazySeasons
         :type geoblocked: bool
         :type channel: str
-        :type legal: str
+        :type legal: tuple[str]
         :type my_list: bool
         :type available: bool
         """
@@ -135,32 +279,225 @@ class Program:
         self.legal = legal
         self.my_list = my_list
         self.available = available
+        self._index = None
 
-    def __repr__(self):
-        return "%r" % self.__dict__
+    @classmethod
+    def from_api_json(cls, data, seasons=None):
+        """ Create a Program from the json of the details of a program.
 
+        :type data: dict
+        :type seasons: dict[int, Season]|LazySeasons
+        :rtype: Program
+        """
+        blocked_for = data.get('blockedFor')
+        return cls(
+            program_id=data.get('id'),
+            name=data.get('name'),
+            description=data.get('description'),
+            thumb=data.get('landscapeTeaserImageUrl'),
+            fanart=data.get('backgroundImageUrl'),
+            geoblocked=blocked_for == 'GEO',
+            seasons=seasons,
+            channel=parse_channel(data.get('channelLogoUrl')),
+            legal=parse_legal(data.get('legalIcons')),
+            # my_list=data.get('addedToMyList'),  # Don't use addedToMyList, since we might have cached this info
+            available=blocked_for != 'SUBSCRIPTION',
+        )
+
+    def to_snapshot(self):
+        """ Return the attributes as a list. The seasons are cached separately, only their indices are kept.
+
+        :rtype: list
+        """
+        values = super(Program, self).to_snapshot()  # pylint: disable=super-with-arguments
+        values[self.__slots__.index('seasons')] = list(self.seasons.keys())
+        values[self.__slots__.index('_index')] = None
+        return values
+
+    @classmethod
+    def from_snapshot(cls, values, loader=None, seasons=None, requested=None):
+        """ Restore a Program from a snapshot.
+
+        :param list values:             The snapshot, as returned by to_snapshot().
+        :param callable loader:         Loads the seasons when they are accessed, see LazySeasons.
+        :param dict[int, Season] seasons:   The seasons that are already loaded.
+        :param list[int] requested:     The season indices that were already looked up, they aren't loaded again.
+        :rtype: Program
+        """
+        obj = super(Program, cls).from_snapshot(values)  # pylint: disable=super-with-arguments
+        obj.seasons = LazySeasons(obj.seasons, loader, seasons=seasons, requested=requested)
+        return obj
+
+    def _get_index(self):
+        """ Return the index of the episodes. It's built on the first lookup, since that loads all seasons of a LazySeasons.
+
+        :returns:                       A dictionary with the episodes by id, the sorted (season, number) keys, and the episodes by key.
+        :rtype: tuple[dict[str, Episode], list[tuple[int, int]], dict[tuple[int, int], Episode]]
+        """
+        if self._index is None:
+            by_id = {}
+            by_key = {}
+            for season in self.seasons.values():
+                for episode in season.episodes.values():
+                    by_id[episode.episode_id] = episode
+                    if episode.season is not None and episode.number is not None:
+                        by_key[(episode.season, episode.number)] = episode
+            self._index = (by_id, sorted(by_key), by_key)
+        return self._index
+
+    def get_episode(self, episode_id):
+        """ Return the episode with the specified id.
 
-class Season:
+        :type episode_id: str
+        :rtype: Episode|None
+        """
+        return self._get_index()[0].get(episode_id)
+
+    def get_next_episode(self, season, number):
+        """ Return the episode that follows the specified episode, this can be the first episode of a later season.
+
+        :type season: int
+        :type number: int
+        :rtype: Episode|None
+        """
+        _, keys, by_key = self._get_index()
+        position = bisect_right(keys, (season, number))
+        return by_key[keys[position]] if position < len(keys) else None
+
+    def get_previous_episode(self, season, number):
+        """ Return the episode that precedes the specified episode, this can be the last episode of an earlier season.
+
+        :type season: int
+        :type number: int
+        :rtype: Episode|None
+        """
+        _, keys, by_key = self._get_index()
+        position = bisect_left(keys, (season, number))
+        return by_key[keys[position - 1]] if position > 0 else None
+
+
+class Season(_Model):
     """ Defines a Season """
+    __slots__ = ('number', 'episodes', 'channel', 'legal')
 
     def __init__(self, number=None, episodes=None, channel=None, legal=None):
         """
         :type number: str
         :type episodes: dict[int, Episode]
         :type channel: str
-        :type legal: str
+        :type legal: tuple[str]
         """
         self.number = int(number)
         self.episodes = episodes if episodes else {}
         self.channel = channel
         self.legal = legal
 
+    @classmethod
+    def from_api_json(cls, data, program, season_index):
+        """ Create a Season from the json of a season.
+
+        :type data: dict
+        :type program: Program
+        :type season_index: int
+        :rtype: Season
+        """
+        episodes = {}
+        for item in data.get('episodes', []):
+            episodes[item.get('index')] = Episode.from_api_json(item, program, season_index)
+
+        return cls(
+            number=season_index,
+            episodes=episodes,
+            channel=program.channel,
+            legal=program.legal,
+        )
+
+    def to_snapshot(self):
+        """ Return the attributes as a list, including the episodes.
+
+        :rtype: list
+        """
+        values = super(Season, self).to_snapshot()  # pylint: disable=super-with-arguments
+        values[self.__slots__.index('episodes')] = [[key, episode.to_snapshot()] for key, episode in self.episodes.items()]
+        return values
+
+    @classmethod
+    def from_snapshot(cls, values):
+        """ Restore a Season from a snapshot, including the episodes.
+
+        :param list values:             The snapshot, as returned by to_snapshot().
+        :rtype: Season
+        """
+        obj = super(Season, cls).from_snapshot(values)  # pylint: disable=super-with-arguments
+        obj.episodes = {key: Episode.from_snapshot(episode) for key, episode in obj.episodes}
+        return obj
+
+
+class LazySeasons(Mapping):
+    """ A read-only dictionary of the seasons of a Program that only loads a season when it is accessed """
+
+    def __init__(self, season_indices, loader, seasons=None, requested=None):
+        """
+        :type season_indices: list[int]
+        :param callable loader:         Returns a dict[int, Season] for a list of season indices.
+        :param dict[int, Season] seasons:   The seasons that are already loaded.
+        :param list[int] requested:     The season indices that were already looked up, also when they couldn't be loaded.
+        """
+        self._season_indices = list(season_indices)
+        self._loader = loader
+        self._seasons = dict(seasons or {})
+        self._requested = set(self._seasons).union(requested or [])
+
+    def _load(self, season_indices):
+        """ Load the specified seasons that we haven't requested yet.
+
+        :type season_indices: list[int]
+        """
+        missing = [season_index for season_index in season_indices if season_index not in self._requested]
+        if missing:
+            self._requested.update(missing)
+            self._seasons.update(self._loader(missing))
+
+    def __getitem__(self, season_index):
+        if season_index not in self._season_indices:
+            raise KeyError(season_index)
+        self._load([season_index])
+        if season_index not in self._seasons:
+            # The loader only skips a season when it isn't cached and we can't use the API
+            raise NetworkException('Season %s is not available offline' % season_index)
+        return self._seasons[season_index]
+
+    def __contains__(self, season_index):
+        return season_index in self._season_indices
+
+    def __iter__(self):
+        return iter(self._season_indices)
+
+    def __len__(self):
+        return len(self._season_indices)
+
+    def keys(self):
+        """ Return the season indices without loading the seasons. """
+        return list(self._season_indices)
+
+    def values(self):
+        """ Return the seasons, all seasons that are not loaded yet are loaded in one go. Seasons that can't be loaded are skipped. """
+        self._load(self._season_indices)
+        return [self._seasons[season_index] for season_index in self._season_indices if season_index in self._seasons]
+
+    def items(self):
+        """ Return the seasons as (index, season) tuples. Seasons that can't be loaded are skipped. """
+        self._load(self._season_indices)
+        return [(season_index, self._seasons[season_index]) for season_index in self._season_indices if season_index in self._seasons]
+
     def __repr__(self):
-        return "%r" % self.__dict__
+        return "%r" % self._seasons
 
 
-class Episode:
+class Episode(_Model):
     """ Defines an Episode """
+    __slots__ = ('episode_id', 'program_id', 'program_name', 'number', 'season', 'name', 'description', 'poster', 'thumb', 'fanart', 'duration',
+                 'remaining', 'geoblocked', 'channel', 'legal', 'aired', 'progress', 'watched', 'next_episode', 'available')
 
     def __init__(self, episode_id=None, program_id=None, program_name=None, number=None, season=None, name=None, description=None, poster=None, thumb=None,
                  fanart=None, duration=None, remaining=None, geoblocked=None, channel=None, legal=None, aired=None, progress=None, watched=False,
@@ -180,21 +517,22 @@ class Episode:
         :type remaining: int
         :type geoblocked: bool
         :type channel: str
-        :type legal: str
+        :type legal: tuple[str]
         :type aired: str
         :type progress: int
         :type watched: bool
         :type next_episode: Episode
         :type available: bool
         """
-        import re
         self.episode_id = episode_id
         self.program_id = program_id
         self.program_name = program_name
         self.number = int(number) if number else None
         self.season = int(season) if season else None
         if number:
-            self.name = re.compile('^%d. ' % number).sub('', name)  # Strip episode from name
+            # Strip episode from name
+            match = _EPISODE_PREFIX.match(name)
+            self.name = name[match.end():] if match and int(match.group(1)) == self.number else name
         else:
             self.name = name
         self.description = description if description else ''
@@ -212,8 +550,50 @@ class Episode:
         self.next_episode = next_episode
         self.available = available
 
-    def __repr__(self):
-        return "%r" % self.__dict__
+    def to_snapshot(self):
+        """ Return the attributes as a list. The next episode is not included.
+
+        :rtype: list
+        """
+        values = super(Episode, self).to_snapshot()  # pylint: disable=super-with-arguments
+        values[self.__slots__.index('next_episode')] = None
+        return values
+
+    @classmethod
+    def from_api_json(cls, data, program, season_index):
+        """ Create an Episode from the json of an episode in a season.
+
+        :type data: dict
+        :type program: Program
+        :type season_index: int
+        :rtype: Episode
+        """
+        return cls(
+            episode_id=data.get('id'),
+            program_id=program.program_id,
+            program_name=program.name,
+            number=data.get('index'),
+            season=season_index,
+            name=data.get('name'),
+            description=data.get('description'),
+            duration=data.get('durationSeconds'),
+            thumb=data.get('imageUrl'),
+            fanart=data.get('imageUrl'),
+            geoblocked=program.geoblocked,
+            remaining=data.get('remainingDaysAvailable'),
+            channel=program.channel,
+            legal=program.legal,
+            aired=data.get('broadcastTimestamp'),
+            progress=data.get('playerPositionSeconds', 0),
+            watched=data.get('doneWatching', False),
+            available=data.get('blockedFor') != 'SUBSCRIPTION',
+        )
+
+
+# The version of the snapshots in the cache. Snapshots are lists in the order of the slots, so the version is derived from the slots of the
+# models that are cached, and older snapshots are not used anymore when a slot is added, removed or moved.
+SNAPSHOT_VERSION = '%d.%08x' % (SNAPSHOT_FORMAT, zlib.crc32(';'.join('%s:%s' % (model.__name__, ','.join(model.__slots__))
+                                                                     for model in [Movie, Program, Season, Episode]).encode('utf-8')) & 0xffffffff)
 
 
 class ResolvedStream:
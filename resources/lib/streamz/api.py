@@ -3,11 +3,14 @@
 
 from __future__ import absolute_import, division, unicode_literals
 
-import json
 import logging
+import threading
+from collections import OrderedDict
 
-from resources.lib import kodiutils
-from resources.lib.streamz import API_ANDROID_ENDPOINT, API_ENDPOINT, Category, Episode, Movie, Program, Season, util
+from resources.lib import codec, kodiutils
+from resources.lib.cache import NO_EXPIRY
+from resources.lib.streamz import API_ANDROID_ENDPOINT, API_ENDPOINT, SNAPSHOT_VERSION, Category, Episode, Movie, Program, Season, util
+from resources.lib.streamz.exceptions import NetworkException
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -16,142 +19,262 @@ try:  # Python 3
 except ImportError:  # Python 2
     from urllib import quote
 
-CACHE_AUTO = 1  # Allow to use the cache, and query the API if no cache is available
-CACHE_ONLY = 2  # Only use the cache, don't use the API
+CACHE_AUTO = 1  # Allow to use the cache, and query the API if no cache is available or when it is expired
+CACHE_ONLY = 2  # Only use the cache, even when it is expired, don't use the API
 CACHE_PREVENT = 3  # Don't use the cache
 
 CONTENT_TYPE_MOVIE = 'MOVIE'
 CONTENT_TYPE_PROGRAM = 'PROGRAM'
 CONTENT_TYPE_EPISODE = 'EPISODE'
 
+SEASON_FETCH_WORKERS = 4  # Maximum amount of seasons that are fetched in parallel
+
+SEASON_CACHE_TTL_OPEN = 3600  # 1 hour, the most recent season can still get new episodes. Older seasons use the ttl of the cache policy.
+
+CACHE_MAX_STALENESS = 24 * 3600  # Expired items are used up to 1 day after they have expired, while they are refreshed in the background
+
+OFFLINE_TIMEOUT = 10  # Maximum amount of seconds we wait for the API when we have a cached version to fall back to
+
+HYDRATE_WORKERS = 6  # Maximum amount of details of a listing that are fetched in parallel
+HYDRATE_BUDGET = 3  # Maximum amount of seconds we wait for the details of a listing, the rest is finished in the background
+
+# The cache keys that are currently being refreshed in the background
+_REFRESHING = set()
+_REFRESHING_LOCK = threading.Lock()
+
+# The executor that fetches the details of listings, it is shared so the fetches that didn't finish in time keep running in the background
+_HYDRATE_LOCK = threading.Lock()
+
+
+def _get_hydrate_executor():
+    """ Return the executor that fetches the details of listings. It is created on the first call.
+
+    :rtype: concurrent.futures.ThreadPoolExecutor
+    """
+    if not hasattr(_get_hydrate_executor, 'cached'):
+        with _HYDRATE_LOCK:
+            if not hasattr(_get_hydrate_executor, 'cached'):
+                from concurrent.futures import ThreadPoolExecutor
+                _get_hydrate_executor.cached = ThreadPoolExecutor(max_workers=HYDRATE_WORKERS)
+    return _get_hydrate_executor.cached
+
 
 class Api:
     """ Streamz API """
 
-    def __init__(self, tokens):
+    def __init__(self, tokens, max_workers=SEASON_FETCH_WORKERS, hydrate=False):
         """ Initialise object
         :param resources.lib.vtmgo.vtmgoauth.AccountStorage token:       An authenticated token.
+        :param int max_workers:                                          The maximum amount of parallel requests.
+        :param bool hydrate:                                             Fetch the details of the teasers in a listing that are not cached.
         """
         self._tokens = tokens
+        self._max_workers = max_workers
+        self._hydrate = hydrate
+        self.offline = False  # Set when the API couldn't be reached, and we are serving cached data of any age
 
     def _mode(self):
         """ Return the mode that should be used for API calls. """
         return self._tokens.product
 
+    def _get_cached(self, key, fetch, cache=CACHE_AUTO, on_update=None, parse=None):
+        """ Return an item from the cache, or fetch it from the API and store it in the cache.
+        With CACHE_AUTO, an item that has expired recently is returned immediately, and refreshed in the background.
+        When the API can't be reached, we go offline and return the cached version regardless of its age.
+
+        :param list[str] key:           The cache key.
+        :param callable fetch:          Makes the request to the API, and accepts the validators to send along.
+        :param int cache:               The cache mode.
+        :param callable on_update:      Called with the previous and the new version of the item when it has changed.
+        :param callable parse:          Converts the response to the item that is cached. The response is cached as is by default.
+        :returns:                       The item, or None when it isn't cached and we can only use the cache.
+        """
+        if cache == CACHE_ONLY:
+            return kodiutils.get_cache(key, ttl=NO_EXPIRY)
+
+        if cache == CACHE_AUTO:
+            data, fresh = kodiutils.get_cache_entry(key, max_stale=CACHE_MAX_STALENESS)
+            if data:
+                if not fresh and not self.offline:
+                    self._refresh_in_background(key, fetch, on_update, parse)
+                return data
+
+        # Without a cached version, we can only wait for the API
+        fallback = kodiutils.get_cache(key, ttl=NO_EXPIRY)
+        if fallback is None:
+            if self.offline:
+                raise NetworkException('%s is not available offline' % '.'.join(key))
+            return self._fetch_cached(key, fetch, on_update, parse)
+
+        if not self.offline:
+            try:
+                with util.deadline(OFFLINE_TIMEOUT):
+                    return self._fetch_cached(key, fetch, on_update, parse)
+            except NetworkException as exc:
+                _LOGGER.warning('Could not reach the API, continuing offline: %s', exc)
+                self.offline = True
+
+        return fallback
+
+    @staticmethod
+    def _fetch_cached(key, fetch, on_update=None, parse=None):
+        """ Fetch an item from the API and store it in the cache. When we have a cached version, we send its validators along, so the
+        API can reply with a 304 Not Modified. We then reuse the cached version and only mark it as fresh again.
+
+        :param list[str] key:           The cache key.
+        :param callable fetch:          Makes the request to the API, and accepts the validators to send along.
+        :param callable on_update:      Called with the previous and the new version of the item when it has changed.
+        :param callable parse:          Converts the response to the item that is cached.
+        :returns:                       The item.
+        """
+        previous, validators = kodiutils.get_cache_validators(key)
+        response = fetch(validators)
+        if response.status_code == 304 and previous is not None:
+            kodiutils.touch_cache(key)
+            return previous
+
+        data = codec.loads(response.content) if response.content else None
+        if parse and data is not None:
+            data = parse(data)
+        if on_update:
+            on_update(previous if previous is not None else kodiutils.get_cache(key, ttl=NO_EXPIRY), data)
+        kodiutils.set_cache(key, data, validators=util.get_validators(response))
+        return data
+
+    @staticmethod
+    def _refresh_in_background(key, fetch, on_update=None, parse=None):
+        """ Fetch an item from the API in a background thread, and store it in the cache. Only one refresh per key is done at a time.
+
+        :param list[str] key:           The cache key.
+        :param callable fetch:          Makes the request to the API, and accepts the validators to send along.
+        :param callable on_update:      Called with the previous and the new version of the item when it has changed.
+        :param callable parse:          Converts the response to the item that is cached.
+        """
+        cache_key = '.'.join(key)
+        with _REFRESHING_LOCK:
+            if cache_key in _REFRESHING:
+                return
+            _REFRESHING.add(cache_key)
+
+        def refresh():
+            """ Refresh the item. """
+            try:
+                Api._fetch_cached(key, fetch, on_update, parse)
+            except Exception as exc:  # pylint: disable=broad-except
+                _LOGGER.warning('Could not refresh %s: %s', cache_key, exc)
+            finally:
+                with _REFRESHING_LOCK:
+                    _REFRESHING.discard(cache_key)
+
+        _LOGGER.debug('Refreshing %s in the background', cache_key)
+        thread = threading.Thread(target=refresh, name='refresh-%s' % cache_key)
+        thread.daemon = True
+        thread.start()
+
     @staticmethod
     def get_config():
         """ Returns the config for the app. """
-        response = util.http_get(API_ANDROID_ENDPOINT + '/streamz/config')
-        info = json.loads(response.text)
+        info = util.http_get_json(API_ANDROID_ENDPOINT + '/streamz/config')
 
         # This contains a player.updateIntervalSeconds that could be used to notify Streamz about the playing progress
         return info
 
-    def get_storefront(self, storefront):
+    def get_storefront(self, storefront, cache=CACHE_AUTO):
         """ Returns a storefront.
 
          :param str storefront:         The ID of the storefront.
+         :param int cache:              The cache mode.
          :rtype: list[Category|Program|Movie]
          """
-        response = util.http_get(API_ENDPOINT + '/%s/storefronts/%s' % (self._mode(), storefront),
+        def fetch(validators=None):
+            """ Fetch the storefront from the API. """
+            return util.http_get(API_ENDPOINT + '/%s/storefronts/%s' % (self._mode(), storefront),
                                  token=self._tokens.access_token,
-                                 profile=self._tokens.profile)
-        result = json.loads(response.text)
+                                 profile=self._tokens.profile,
+                                 validators=validators)
+
+        result = self._get_cached(['storefront', self._tokens.profile, storefront], fetch, cache=cache) or {}
 
+        # The teasers are kept in place, so they can be parsed together afterwards
         items = []
         for row in result.get('rows', []):
             if row.get('rowType') in ['SWIMLANE_DEFAULT', 'SWIMLANE_PORTRAIT', 'SWIMLANE_LANDSCAPE']:
-                items.append(Category(
-                    category_id=row.get('id'),
-                    title=row.get('title'),
-                ))
+                items.append(Category.from_api_json(row))
                 continue
 
             if row.get('rowType') == 'CAROUSEL':
                 for item in row.get('teasers'):
-                    if item.get('target', {}).get('type') == CONTENT_TYPE_MOVIE:
-                        items.append(self._parse_movie_teaser(item))
-
-                    elif item.get('target', {}).get('type') == CONTENT_TYPE_PROGRAM:
-                        items.append(self._parse_program_teaser(item))
+                    if item.get('target', {}).get('type') in [CONTENT_TYPE_MOVIE, CONTENT_TYPE_PROGRAM]:
+                        items.append(item)
                 continue
 
             if row.get('rowType') in ['TOP_BANNER', 'MARKETING_BLOCK']:
                 item = row.get('teaser')
-                if item.get('target', {}).get('type') == CONTENT_TYPE_MOVIE:
-                    items.append(self._parse_movie_teaser(item))
-
-                elif item.get('target', {}).get('type') == CONTENT_TYPE_PROGRAM:
-                    items.append(self._parse_program_teaser(item))
+                if item.get('target', {}).get('type') in [CONTENT_TYPE_MOVIE, CONTENT_TYPE_PROGRAM]:
+                    items.append(item)
                 continue
 
             _LOGGER.debug('Skipping recommendation %s with type %s', row.get('title'), row.get('rowType'))
 
-        return items
+        parsed = iter(self._parse_teasers([item for item in items if not isinstance(item, Category)]))
+        return [item if isinstance(item, Category) else next(parsed) for item in items]
 
-    def get_storefront_category(self, storefront, category):
+    def get_storefront_category(self, storefront, category, cache=CACHE_AUTO):
         """ Returns a storefront.
 
          :param str storefront:         The ID of the storefront.
          :param str category:           The ID of the category.
+         :param int cache:              The cache mode.
          :rtype: Category
          """
-        response = util.http_get(API_ENDPOINT + '/%s/storefronts/%s/detail/%s' % (self._mode(), storefront, category),
+        def fetch(validators=None):
+            """ Fetch the category from the API. """
+            return util.http_get(API_ENDPOINT + '/%s/storefronts/%s/detail/%s' % (self._mode(), storefront, category),
                                  token=self._tokens.access_token,
-                                 profile=self._tokens.profile)
-        result = json.loads(response.text)
-
-        items = []
-        for item in result.get('row', {}).get('teasers', []):
-            if item.get('target', {}).get('type') == CONTENT_TYPE_MOVIE:
-                items.append(self._parse_movie_teaser(item))
+                                 profile=self._tokens.profile,
+                                 validators=validators)
 
-            elif item.get('target', {}).get('type') == CONTENT_TYPE_PROGRAM:
-                items.append(self._parse_program_teaser(item))
+        result = self._get_cached(['storefront', self._tokens.profile, storefront, category], fetch, cache=cache) or {}
 
-            elif item.get('target', {}).get('type') == CONTENT_TYPE_EPISODE:
-                items.append(self._parse_episode_teaser(item))
+        items = self._parse_teasers([item for item in result.get('row', {}).get('teasers', [])
+                                     if item.get('target', {}).get('type') in [CONTENT_TYPE_MOVIE, CONTENT_TYPE_PROGRAM, CONTENT_TYPE_EPISODE]])
 
         return Category(category_id=category, title=result.get('row', {}).get('title'), content=items)
 
     def get_mylist(self, content_filter=None, cache=CACHE_ONLY):
         """ Returns the contents of My List """
-        response = util.http_get(API_ENDPOINT + '/%s/my-list' % (self._mode()),
+        def fetch(validators=None):
+            """ Fetch My List from the API. """
+            return util.http_get(API_ENDPOINT + '/%s/my-list' % (self._mode()),
                                  token=self._tokens.access_token,
-                                 profile=self._tokens.profile)
+                                 profile=self._tokens.profile,
+                                 validators=validators)
+
+        # My List can be changed on other devices, so we always check the API. The cached version is used when we are offline.
+        result = self._get_cached(['swimlane', self._tokens.profile, 'my-list'], fetch, cache=CACHE_PREVENT)
 
         # Result can be empty
-        if not response.text:
+        if not result:
             return []
 
-        result = json.loads(response.text)
-
-        items = []
-        for item in result.get('teasers'):
-            if item.get('target', {}).get('type') == CONTENT_TYPE_MOVIE and content_filter in [None, Movie]:
-                items.append(self._parse_movie_teaser(item, cache=cache))
-
-            elif item.get('target', {}).get('type') == CONTENT_TYPE_PROGRAM and content_filter in [None, Program]:
-                items.append(self._parse_program_teaser(item, cache=cache))
-
-            elif item.get('target', {}).get('type') == CONTENT_TYPE_EPISODE and content_filter in [None, Episode]:
-                items.append(self._parse_episode_teaser(item, cache=cache))
-
-        return items
+        content_types = {CONTENT_TYPE_MOVIE: Movie, CONTENT_TYPE_PROGRAM: Program, CONTENT_TYPE_EPISODE: Episode}
+        return self._parse_teasers([item for item in result.get('teasers')
+                                    if item.get('target', {}).get('type') in content_types
+                                    and content_filter in [None, content_types[item.get('target', {}).get('type')]]], cache=cache)
 
     def add_mylist(self, content_id):
         """ Add an item to My List. """
         util.http_put(API_ENDPOINT + '/%s/userData/myList/%s' % (self._mode(), content_id),
                       token=self._tokens.access_token,
                       profile=self._tokens.profile)
-        kodiutils.set_cache(['swimlane', 'my-list'], None)
+        kodiutils.set_cache(['swimlane', self._tokens.profile, 'my-list'], None)
 
     def del_mylist(self, content_id):
         """ Delete an item from My List. """
         util.http_delete(API_ENDPOINT + '/%s/userData/myList/%s' % (self._mode(), content_id),
                          token=self._tokens.access_token,
                          profile=self._tokens.profile)
-        kodiutils.set_cache(['swimlane', 'my-list'], None)
+        kodiutils.set_cache(['swimlane', self._tokens.profile, 'my-list'], None)
 
     def get_movie(self, movie_id, cache=CACHE_AUTO):
         """ Get the details of the specified movie.
@@ -160,39 +283,20 @@ class Api:
         :type cache: int
         :rtype Movie
         """
-        if cache in [CACHE_AUTO, CACHE_ONLY]:
-            # Try to fetch from cache
-            movie = kodiutils.get_cache(['movie', movie_id])
-            if movie is None and cache == CACHE_ONLY:
-                return None
-        else:
-            movie = None
+        def fetch(validators=None):
+            """ Fetch the movie from the API. """
+            return util.http_get(API_ENDPOINT + '/%s/detail/%s' % (self._mode(), movie_id),
+                                 token=self._tokens.access_token,
+                                 profile=self._tokens.profile,
+                                 validators=validators)
 
-        if not movie:
-            # Fetch from API
-            response = util.http_get(API_ENDPOINT + '/%s/detail/%s' % (self._mode(), movie_id),
-                                     token=self._tokens.access_token,
-                                     profile=self._tokens.profile)
-            movie = json.loads(response.text)
-            kodiutils.set_cache(['movie', movie_id], movie)
+        # We cache a snapshot of the model, so we don't need to map the response again
+        movie = self._get_cached(self._snapshot_key('movie', movie_id), fetch, cache=cache,
+                                 parse=lambda data: Movie.from_api_json(data).to_snapshot())
+        if movie is None:
+            return None
 
-        return Movie(
-            movie_id=movie.get('id'),
-            name=movie.get('name'),
-            description=movie.get('description'),
-            duration=movie.get('durationSeconds'),
-            poster=movie.get('portraitTeaserImageUrl'),
-            thumb=movie.get('landscapeTeaserImageUrl'),
-            fanart=movie.get('backgroundImageUrl'),
-            year=movie.get('productionYear'),
-            geoblocked=movie.get('blockedFor') == 'GEO',
-            remaining=movie.get('remainingDaysAvailable'),
-            legal=movie.get('legalIcons'),
-            # aired=movie.get('broadcastTimestamp'),
-            channel=self._parse_channel(movie.get('channelLogoUrl')),
-            # my_list=program.get('addedToMyList'),  # Don't use addedToMyList, since we might have cached this info
-            available=movie.get('blockedFor') != 'SUBSCRIPTION',
-        )
+        return Movie.from_snapshot(movie)
 
     def get_program(self, program_id, cache=CACHE_AUTO):
         """ Get the details of the specified program.
@@ -201,76 +305,132 @@ class Api:
         :type cache: int
         :rtype Program
         """
-        if cache in [CACHE_AUTO, CACHE_ONLY]:
-            # Try to fetch from cache
-            program = kodiutils.get_cache(['program', program_id])
-            if program is None and cache == CACHE_ONLY:
-                return None
-        else:
-            program = None
+        def fetch(validators=None):
+            """ Fetch the program from the API. """
+            return util.http_get(API_ENDPOINT + '/%s/detail/%s' % (self._mode(), program_id),
+                                 token=self._tokens.access_token,
+                                 profile=self._tokens.profile,
+                                 validators=validators)
 
-        if not program:
-            # Fetch from API
-            response = util.http_get(API_ENDPOINT + '/%s/detail/%s' % (self._mode(), program_id),
-                                     token=self._tokens.access_token,
-                                     profile=self._tokens.profile)
-            program = json.loads(response.text)
-            kodiutils.set_cache(['program', program_id], program)
+        def parse(data):
+            """ Return the snapshot of the program. The seasons are cached separately, so we only keep their indices. """
+            return Program.from_api_json(data, seasons=dict.fromkeys(data.get('seasonIndices', []))).to_snapshot()
 
-        channel = self._parse_channel(program.get('channelLogoUrl'))
+        # We cache a snapshot of the model. When the program has changed, the season that is still airing needs to be fetched again.
+        snapshot = self._get_cached(self._snapshot_key('program', program_id), fetch, cache=cache, on_update=self._expire_open_seasons, parse=parse)
+        if snapshot is None:
+            return None
+
+        return self._restore_program(snapshot, cache=cache)
+
+    def _restore_program(self, snapshot, cache=CACHE_AUTO, seasons=None, requested=None):
+        """ Restore a Program from its snapshot. The seasons are only fetched when they are accessed. Closed seasons are reused from the
+        cache, even when we refresh the program.
+
+        :param list snapshot:           The snapshot of the program.
+        :param int cache:               The cache mode.
+        :param dict[int, Season] seasons:   The seasons that are already loaded.
+        :param list[int] requested:     The season indices that were already looked up, they aren't loaded again.
+        :rtype Program
+        """
+        def load_seasons(season_indices):
+            """ Load the seasons, only from the cache when we are offline. """
+            return self._get_seasons(program, season_indices, cache=CACHE_ONLY if cache == CACHE_ONLY or self.offline else CACHE_AUTO)
 
+        program = Program.from_snapshot(snapshot, loader=load_seasons, seasons=seasons, requested=requested)
+        return program
+
+    def _get_seasons(self, program, season_indices, cache=CACHE_AUTO):
+        """ Get the specified seasons of a program. Seasons that are not cached are fetched in parallel.
+
+        :type program: Program
+        :type season_indices: list[int]
+        :type cache: int
+        :rtype dict[int, Season]
+        """
         seasons = {}
-        for item_season in program.get('seasonIndices', []):
-            episodes = {}
-
-            # Fetch season
-            season_response = util.http_get(API_ENDPOINT + '/%s/detail/%s?selectedSeasonIndex=%s' % (self._mode(), program_id, item_season),
-                                            token=self._tokens.access_token,
-                                            profile=self._tokens.profile)
-            season = json.loads(season_response.text).get('selectedSeason')
-
-            for item_episode in season.get('episodes', []):
-                episodes[item_episode.get('index')] = Episode(
-                    episode_id=item_episode.get('id'),
-                    program_id=program_id,
-                    program_name=program.get('name'),
-                    number=item_episode.get('index'),
-                    season=item_season,
-                    name=item_episode.get('name'),
-                    description=item_episode.get('description'),
-                    duration=item_episode.get('durationSeconds'),
-                    thumb=item_episode.get('imageUrl'),
-                    fanart=item_episode.get('imageUrl'),
-                    geoblocked=program.get('blockedFor') == 'GEO',
-                    remaining=item_episode.get('remainingDaysAvailable'),
-                    channel=channel,
-                    legal=program.get('legalIcons'),
-                    aired=item_episode.get('broadcastTimestamp'),
-                    progress=item_episode.get('playerPositionSeconds', 0),
-                    watched=item_episode.get('doneWatching', False),
-                    available=item_episode.get('blockedFor') != 'SUBSCRIPTION',
-                )
-
-            seasons[item_season] = Season(
-                number=item_season,
-                episodes=episodes,
-                channel=channel,
-                legal=program.get('legalIcons'),
-            )
+        if cache in [CACHE_AUTO, CACHE_ONLY]:
+            # Try to fetch from cache, every season is cached with its own timestamp. The season that is still airing has a shorter ttl.
+            keys = {season_index: self._snapshot_key('season', program.program_id, str(season_index)) for season_index in season_indices}
+            if cache == CACHE_ONLY:
+                groups = [(NO_EXPIRY, season_indices)]
+            else:
+                groups = [(None, [season_index for season_index in season_indices if not self._is_open_season(program, season_index)]),
+                          (SEASON_CACHE_TTL_OPEN, [season_index for season_index in season_indices if self._is_open_season(program, season_index)])]
+            for ttl, indices in groups:
+                if not indices:
+                    continue
+                cached = kodiutils.get_cache_many([keys[season_index] for season_index in indices], ttl=ttl)
+                for season_index in indices:
+                    if tuple(keys[season_index]) in cached:
+                        seasons[season_index] = Season.from_snapshot(cached[tuple(keys[season_index])])
+
+        # Fetch the remaining seasons from the API, unless we are only allowed to use the cache
+        missing = [season_index for season_index in season_indices if season_index not in seasons]
+        if missing and cache != CACHE_ONLY:
+            responses = util.http_get_many([
+                dict(url=API_ENDPOINT + '/%s/detail/%s?selectedSeasonIndex=%s' % (self._mode(), program.program_id, season_index),
+                     token=self._tokens.access_token,
+                     profile=self._tokens.profile)
+                for season_index in missing
+            ], max_workers=self._max_workers)
+
+            # The responses are returned in the order of the requests, so the ordering stays deterministic
+            for season_index, response in zip(missing, responses):
+                key = self._snapshot_key('season', program.program_id, str(season_index))
+                if isinstance(response, NetworkException):
+                    # Fall back to an expired version of the season
+                    season = kodiutils.get_cache(key, ttl=NO_EXPIRY)
+                    if season is None:
+                        raise response
+                    _LOGGER.warning('Could not reach the API, continuing offline: %s', response)
+                    self.offline = True
+                    seasons[season_index] = Season.from_snapshot(season)
+                    continue
+                if isinstance(response, Exception):
+                    raise response
+                season = Season.from_api_json(codec.loads(response.content).get('selectedSeason'), program, season_index)
+                kodiutils.set_cache(key, season.to_snapshot())
+                seasons[season_index] = season
+
+        # Seasons that are not available in CACHE_ONLY mode are skipped
+        return {season_index: seasons[season_index] for season_index in season_indices if season_index in seasons}
+
+    def _expire_open_seasons(self, previous, program):
+        """ Remove the seasons from the cache that could have changed since the previous version of the program.
+        New seasons aren't cached yet, and the closed seasons can be reused.
+
+        :param list|None previous:      The snapshot of the previous version of the Program.
+        :param list program:            The snapshot of the new version of the Program.
+        """
+        open_seasons = set()
+        for snapshot in [previous, program]:
+            if snapshot:
+                details = Program.from_snapshot(snapshot)
+                open_seasons.update(season_index for season_index in details.seasons.keys() if self._is_open_season(details, season_index))
 
-        return Program(
-            program_id=program.get('id'),
-            name=program.get('name'),
-            description=program.get('description'),
-            thumb=program.get('landscapeTeaserImageUrl'),
-            fanart=program.get('backgroundImageUrl'),
-            geoblocked=program.get('blockedFor') == 'GEO',
-            seasons=seasons,
-            channel=channel,
-            legal=program.get('legalIcons'),
-            # my_list=program.get('addedToMyList'),  # Don't use addedToMyList, since we might have cached this info
-            available=program.get('blockedFor') != 'SUBSCRIPTION',
-        )
+        program_id = Program.from_snapshot(program).program_id
+        for season_index in open_seasons:
+            kodiutils.set_cache(self._snapshot_key('season', program_id, str(season_index)), None)
+
+    @staticmethod
+    def _is_open_season(program, season_index):
+        """ Check if a season can still get new episodes. We assume this is only the case for the most recent season.
+
+        :type program: Program
+        :type season_index: int
+        :rtype bool
+        """
+        return season_index == max(program.seasons.keys() or [season_index])
+
+    @staticmethod
+    def _snapshot_key(namespace, *parts):
+        """ Return the cache key of a snapshot of a model. The key contains the version of the snapshots, so older snapshots are ignored.
+
+        :param str namespace:           The namespace, this determines the ttl of the item.
+        :rtype: list[str]
+        """
+        return [namespace, 'v%s' % SNAPSHOT_VERSION] + list(parts)
 
     @staticmethod
     def get_episode_from_program(program, episode_id):
@@ -279,12 +439,7 @@ class Api:
         :type episode_id: str
         :rtype Episode
         """
-        for season in list(program.seasons.values()):
-            for episode in list(season.episodes.values()):
-                if episode.episode_id == episode_id:
-                    return episode
-
-        return None
+        return program.get_episode(episode_id)
 
     @staticmethod
     def get_next_episode_from_program(program, season, number):
@@ -294,31 +449,17 @@ class Api:
         :type number: int
         :rtype Episode
         """
-        next_season_episode = None
-
-        # First, try to find a match in the current season
-        for episode in [e for s in list(program.seasons.values()) for e in list(s.episodes.values())]:
-            if episode.season == season and episode.number == number + 1:
-                return episode
-            if episode.season == season + 1 and episode.number == 1:
-                next_season_episode = episode
-
-        # No match, use the first episode of next season
-        if next_season_episode:
-            return next_season_episode
-
-        # We are playing the last episode
-        return None
+        # Returns None when we are playing the last episode
+        return program.get_next_episode(season, number)
 
     def get_episode(self, episode_id):
         """ Get some details of the specified episode.
         :type episode_id: str
         :rtype Episode
         """
-        response = util.http_get(API_ENDPOINT + '/%s/play/%s' % (self._mode(), episode_id),
-                                 token=self._tokens.access_token,
-                                 profile=self._tokens.profile)
-        episode = json.loads(response.text)
+        episode = util.http_get_json(API_ENDPOINT + '/%s/play/%s' % (self._mode(), episode_id),
+                                     token=self._tokens.access_token,
+                                     profile=self._tokens.profile)
 
         # Extract next episode info if available
         next_playable = episode.get('nextPlayable')
@@ -346,29 +487,124 @@ class Api:
         :type search: str
         :rtype list[Union[Movie, Program]]
         """
-        response = util.http_get(API_ENDPOINT + '/%s/search?query=%s' % (self._mode(),
-                                                                         kodiutils.to_unicode(quote(kodiutils.from_unicode(search)))),
-                                 token=self._tokens.access_token,
-                                 profile=self._tokens.profile)
-        results = json.loads(response.text)
+        results = util.http_get_json(API_ENDPOINT + '/%s/search?query=%s' % (self._mode(),
+                                                                             kodiutils.to_unicode(quote(kodiutils.from_unicode(search)))),
+                                     token=self._tokens.access_token,
+                                     profile=self._tokens.profile)
 
-        items = []
-        for category in results.get('results', []):
-            for item in category.get('teasers'):
-                if item.get('target', {}).get('type') == CONTENT_TYPE_MOVIE:
-                    items.append(self._parse_movie_teaser(item))
+        return self._parse_teasers([item for category in results.get('results', []) for item in category.get('teasers')
+                                    if item.get('target', {}).get('type') in [CONTENT_TYPE_MOVIE, CONTENT_TYPE_PROGRAM]])
+
+    def _parse_teasers(self, items, cache=CACHE_ONLY):
+        """ Parse the teasers of a listing. The cached details of all teasers are read from the cache at once, and the seasons of the
+        programs of the episodes in a second read. Teasers without cached details only contain the info of the teaser.
+
+        :type items: list[dict]
+        :param int cache:               The cache mode. Unless we can only use the cache, the details that are not cached are fetched.
+        :rtype list[Union[Movie, Program, Episode]]
+        """
+        targets = [item.get('target', {}) for item in items]
+        keys = [self._snapshot_key('movie', target.get('id')) if target.get('type') == CONTENT_TYPE_MOVIE else
+                self._snapshot_key('program', target.get('programId') if target.get('type') == CONTENT_TYPE_EPISODE else target.get('id'))
+                for target in targets]
+        ttl = NO_EXPIRY if cache == CACHE_ONLY else None
+        snapshots = kodiutils.get_cache_many(keys, ttl=ttl) if keys else {}
+
+        # Episodes need the seasons of their program to find their description
+        season_keys = {}
+        for target, key in zip(targets, keys):
+            if target.get('type') == CONTENT_TYPE_EPISODE and tuple(key) in snapshots:
+                for season_index in Program.from_snapshot(snapshots[tuple(key)]).seasons.keys():
+                    season_key = self._snapshot_key('season', target.get('programId'), str(season_index))
+                    season_keys[tuple(season_key)] = season_key
+        season_snapshots = kodiutils.get_cache_many(list(season_keys.values()), ttl=ttl) if season_keys else {}
+
+        # Fetch the details of the movies and programs that are not cached yet
+        fetched = {}
+        if self._hydrate and cache == CACHE_ONLY and not self.offline:
+            fetched = self._fetch_details([(target.get('type'), target.get('id')) for target, key in zip(targets, keys)
+                                           if target.get('type') in [CONTENT_TYPE_MOVIE, CONTENT_TYPE_PROGRAM] and tuple(key) not in snapshots])
+
+        results = []
+        for item, target, key in zip(items, targets, keys):
+            snapshot = snapshots.get(tuple(key))
+            if target.get('type') == CONTENT_TYPE_MOVIE:
+                if snapshot is not None:
+                    movie = Movie.from_snapshot(snapshot)
+                elif (CONTENT_TYPE_MOVIE, target.get('id')) in fetched:
+                    movie = fetched[(CONTENT_TYPE_MOVIE, target.get('id'))]
+                else:
+                    movie = self.get_movie(target.get('id'), cache=cache) if cache != CACHE_ONLY else None
+                results.append(self._parse_movie_teaser(item, movie))
+                continue
+
+            program_id = target.get('programId') if target.get('type') == CONTENT_TYPE_EPISODE else target.get('id')
+            if snapshot is not None:
+                seasons = {}
+                requested = None
+                if target.get('type') == CONTENT_TYPE_EPISODE:
+                    season_indices = Program.from_snapshot(snapshot).seasons.keys()
+                    for season_index in season_indices:
+                        season = season_snapshots.get(tuple(self._snapshot_key('season', program_id, str(season_index))))
+                        if season is not None:
+                            seasons[season_index] = Season.from_snapshot(season)
+                    # The cache was already checked for all seasons, so looking up the episode doesn't read it again for the missing ones
+                    if cache == CACHE_ONLY:
+                        requested = season_indices
+                program = self._restore_program(snapshot, cache=cache, seasons=seasons, requested=requested)
+            elif (target.get('type'), program_id) in fetched:
+                program = fetched[(target.get('type'), program_id)]
+            else:
+                program = self.get_program(program_id, cache=cache) if cache != CACHE_ONLY else None
+
+            if target.get('type') == CONTENT_TYPE_PROGRAM:
+                results.append(self._parse_program_teaser(item, program))
+            else:
+                results.append(self._parse_episode_teaser(item, program))
+
+        return results
+
+    def _fetch_details(self, targets):
+        """ Fetch the details of movies and programs in parallel, so they are cached. We only wait HYDRATE_BUDGET seconds for them,
+        the details that take longer are still fetched in the background, and are available the next time.
+
+        :param list[tuple[str, str]] targets:   The content types and the ids of the movies and programs.
+        :returns:                       The Movie and Program instances that were fetched in time, by their content type and id.
+        :rtype: dict[tuple[str, str], Movie|Program]
+        """
+        targets = list(OrderedDict.fromkeys(targets))
+        if not targets:
+            return {}
+
+        def fetch(target):
+            """ Fetch the details of one movie or program. """
+            content_type, content_id = target
+            try:
+                if content_type == CONTENT_TYPE_MOVIE:
+                    return self.get_movie(content_id, cache=CACHE_AUTO)
+                return self.get_program(content_id, cache=CACHE_AUTO)
+            except Exception as exc:  # pylint: disable=broad-except
+                _LOGGER.debug('Could not fetch the details of %s %s: %s', content_type, content_id, exc)
+                return None
+
+        from concurrent.futures import wait
+        executor = _get_hydrate_executor()
+        futures = {executor.submit(fetch, target): target for target in targets}
+        done, pending = wait(futures, timeout=HYDRATE_BUDGET)
 
-                elif item.get('target', {}).get('type') == CONTENT_TYPE_PROGRAM:
-                    items.append(self._parse_program_teaser(item))
-        return items
+        # Don't wait for the requests that are still pending, Python only waits for them when the add-on exits
+        if pending:
+            _LOGGER.debug('Fetching the details of %d items in the background', len(pending))
 
-    def _parse_movie_teaser(self, item, cache=CACHE_ONLY):
+        return {futures[future]: future.result() for future in done if future.result() is not None}
+
+    @staticmethod
+    def _parse_movie_teaser(item, movie=None):
         """ Parse the movie json and return a Movie instance.
         :type item: dict
-        :type cache: int
+        :param Movie movie:             The details of the movie, when we have them.
         :rtype Movie
         """
-        movie = self.get_movie(item.get('target', {}).get('id'), cache=cache)
         if movie:
             movie.available = item.get('blockedFor') != 'SUBSCRIPTION'
             return movie
@@ -381,13 +617,13 @@ class Api:
             available=item.get('blockedFor') != 'SUBSCRIPTION',
         )
 
-    def _parse_program_teaser(self, item, cache=CACHE_ONLY):
+    @staticmethod
+    def _parse_program_teaser(item, program=None):
         """ Parse the program json and return a Program instance.
         :type item: dict
-        :type cache: int
+        :param Program program:         The details of the program, when we have them.
         :rtype Program
         """
-        program = self.get_program(item.get('target', {}).get('id'), cache=cache)
         if program:
             program.available = item.get('blockedFor') != 'SUBSCRIPTION'
             return program
@@ -400,13 +636,12 @@ class Api:
             available=item.get('blockedFor') != 'SUBSCRIPTION',
         )
 
-    def _parse_episode_teaser(self, item, cache=CACHE_ONLY):
+    def _parse_episode_teaser(self, item, program=None):
         """ Parse the episode json and return an Episode instance.
         :type item: dict
-        :type cache: int
+        :param Program program:         The details of the program of the episode, when we have them.
         :rtype Episode
         """
-        program = self.get_program(item.get('target', {}).get('programId'), cache=cache)
         episode = self.get_episode_from_program(program, item.get('target', {}).get('id')) if program else None
 
         return Episode(
@@ -421,17 +656,3 @@ class Api:
             watched=False,
             remaining=item.get('remainingDaysAvailable'),
         )
-
-    @staticmethod
-    def _parse_channel(url):
-        """ Parse the channel logo url, and return an icon that matches resource.images.studios.white
-        :type url: str
-        :rtype str
-        """
-        if not url:
-            return None
-
-        import os.path
-
-        # The channels id's we use in resources.lib.modules.CHANNELS neatly matches this part in the url.
-        return str(os.path.basename(url).split('-')[0])
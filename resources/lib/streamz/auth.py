@@ -8,10 +8,10 @@ import logging
 import os
 import uuid
 
-from requests import HTTPError
-
-from resources.lib.streamz import API_ENDPOINT, PRODUCT_STREAMZ, Profile, util
-from resources.lib.streamz.exceptions import NoLoginException
+from resources.lib import codec
+from resources.lib.cache import MemoryCache
+from resources.lib.streamz import API_ENDPOINT, LOGIN_ENDPOINT, PRODUCT_STREAMZ, Profile, util
+from resources.lib.streamz.exceptions import NetworkException, NoLoginException
 
 try:  # Python 3
     import jwt
@@ -21,6 +21,9 @@ except ImportError:  # Python 2
 
 _LOGGER = logging.getLogger(__name__)
 
+# Keep the tokens in memory, so we don't need to read them from disk when Kodi reuses the interpreter
+_TOKEN_CACHE = MemoryCache(max_entries=4)
+
 
 class AccountStorage:
     """ Data storage for account info """
@@ -76,6 +79,9 @@ class Auth:
         self._account = AccountStorage()
         self._load_cache()
 
+        # Refresh the token when the API rejects it
+        util.set_token_refresher(self.refresh_token)
+
     def set_token(self, access_token):
         """ Sets an auth token """
         self._account.access_token = access_token
@@ -89,11 +95,11 @@ class Auth:
 
     def authorize(self):
         """ Start the authorization flow. """
-        response = util.http_post('https://login.streamz.be/oauth/device/code', form={
+        response = util.http_post(LOGIN_ENDPOINT + '/oauth/device/code', form={
             'client_id': self.CLIENT_ID,
             'scope': 'openid',
         })
-        auth_info = json.loads(response.text)
+        auth_info = codec.loads(response.content)
 
         # We only need the device_code
         self._account.device_code = auth_info.get('device_code')
@@ -106,8 +112,9 @@ class Auth:
         if not self._account.device_code:
             raise NoLoginException
 
+        from requests import HTTPError
         try:
-            response = util.http_post('https://login.streamz.be/oauth/token', form={
+            response = util.http_post(LOGIN_ENDPOINT + '/oauth/token', form={
                 'device_code': self._account.device_code,
                 'client_id': self.CLIENT_ID,
                 'grant_type': 'urn:ietf:params:oauth:grant-type:device_code',
@@ -118,7 +125,7 @@ class Auth:
             raise
 
         # Store these tokens
-        auth_info = json.loads(response.text)
+        auth_info = codec.loads(response.content)
         self._account.id_token = auth_info.get('id_token')
         self._account.refresh_token = auth_info.get('refresh_token')
 
@@ -131,7 +138,7 @@ class Auth:
             'idToken': self._account.id_token,
         })
 
-        self._account.access_token = json.loads(response.text).get('lfvpToken')
+        self._account.access_token = codec.loads(response.content).get('lfvpToken')
         self._save_cache()
 
         return True
@@ -147,12 +154,14 @@ class Auth:
             return self._account
 
         # We can refresh our old token so it's valid again
-        response = util.http_post('https://lfvp-api.dpgmedia.net/STREAMZ/tokens/refresh', data={
-            'lfvpToken': self._account.access_token,
-        })
-
-        # Get JWT from reply
-        self._account.access_token = json.loads(response.text).get('lfvpToken')
+        try:
+            self._account.access_token = self._refresh(self._account.access_token)
+        except NetworkException:
+            if not (self._account.profile and self._account.product):
+                raise
+            # Continue with the expired token, so we can still browse the cached content
+            _LOGGER.warning('Could not refresh the token, continuing offline')
+            return self._account
 
         # We always use the main profile
         if not self._account.profile:
@@ -165,24 +174,42 @@ class Auth:
 
         return self._account
 
+    def refresh_token(self, token):
+        """ Refresh a token that was rejected by the API.
+
+        :param str token:               The rejected token.
+        :returns:                       The new token, or None when we have no token.
+        :rtype: str|None
+        """
+        # Another process could already have refreshed the token
+        self._load_cache()
+        if not self._account.access_token:
+            return None
+        if self._account.access_token != token:
+            return self._account.access_token
+
+        self._account.access_token = self._refresh(token)
+        self._save_cache()
+        return self._account.access_token
+
+    @staticmethod
+    def _refresh(token):
+        """ Exchange a token for a new one.
+
+        :param str token:               The current token.
+        :rtype: str
+        """
+        response = util.http_post(API_ENDPOINT + '/STREAMZ/tokens/refresh', data={
+            'lfvpToken': token,
+        })
+        return codec.loads(response.content).get('lfvpToken')
+
     def get_profiles(self):
         """ Returns the available profiles """
         response = util.http_get(API_ENDPOINT + '/STREAMZ/profiles', token=self._account.access_token)
-        result = json.loads(response.text)
-
-        profiles = [
-            Profile(
-                key=profile.get('id'),
-                name=profile.get('name'),
-                gender=profile.get('gender'),
-                birthdate=profile.get('birthDate'),
-                color=profile.get('color', {}).get('start'),
-                color2=profile.get('color', {}).get('end'),
-                main_profile=profile.get('mainProfile'),
-                kids_profile=profile.get('kidsProfile'),
-            )
-            for profile in result.get('profiles')
-        ]
+        result = codec.loads(response.content)
+
+        profiles = [Profile.from_api_json(profile) for profile in result.get('profiles')]
 
         return profiles
 
@@ -193,10 +220,17 @@ class Auth:
 
     def _load_cache(self):
         """ Load tokens from cache """
+        path = os.path.join(self._token_path, self.TOKEN_FILE)
         try:
-            with open(os.path.join(self._token_path, self.TOKEN_FILE), 'r') as fdesc:
-                self._account.__dict__ = json.loads(fdesc.read())  # pylint: disable=attribute-defined-outside-init
-        except (IOError, TypeError, ValueError):
+            # The modification time tells us if the file was changed since we have read it
+            mtime = os.path.getmtime(path)
+            cached = _TOKEN_CACHE.get(path)
+            if cached is None or cached[0] != mtime:
+                with open(path, 'r') as fdesc:
+                    cached = (mtime, json.loads(fdesc.read()))
+                _TOKEN_CACHE.set(path, cached, 1)
+            self._account.__dict__ = dict(cached[1])  # pylint: disable=attribute-defined-outside-init
+        except (IOError, OSError, TypeError, ValueError):
             _LOGGER.warning('We could not use the cache since it is invalid or non-existent.')
 
     def _save_cache(self):
@@ -204,5 +238,7 @@ class Auth:
         if not os.path.exists(self._token_path):
             os.makedirs(self._token_path)
 
-        with open(os.path.join(self._token_path, self.TOKEN_FILE), 'w') as fdesc:
+        path = os.path.join(self._token_path, self.TOKEN_FILE)
+        with open(path, 'w') as fdesc:
             json.dump(self._account.__dict__, fdesc, indent=2)
+        _TOKEN_CACHE.set(path, (os.path.getmtime(path), dict(self._account.__dict__)), 1)
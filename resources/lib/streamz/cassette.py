@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+""" Record and replay the HTTP traffic of the add-on.
+
+Set ADDON_CASSETTE to the path of a cassette file, and ADDON_CASSETTE_MODE to "record" or "replay" (the default).
+In record mode, every request is sent to the network and the response is appended to the cassette.
+In replay mode, the responses are served from the cassette, and requests that are not in the cassette fail.
+Set ADDON_CASSETTE_REALTIME=1 to also replay the recorded response times, so a slow session can be reproduced.
+
+Note that a cassette contains the responses as they were received, including the tokens of the authentication calls.
+"""
+
+from __future__ import absolute_import, division, unicode_literals
+
+import base64
+import json
+import logging
+import os
+import threading
+import time
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.exceptions import ConnectionError  # pylint: disable=redefined-builtin
+from requests.structures import CaseInsensitiveDict
+
+_LOGGER = logging.getLogger(__name__)
+
+MODE_RECORD = 'record'
+MODE_REPLAY = 'replay'
+
+
+class CassetteMissError(ConnectionError):
+    """ A request that is not in the cassette """
+
+
+class Cassette:
+    """ A list of recorded requests and their responses """
+
+    def __init__(self, path, mode=MODE_REPLAY, realtime=False):
+        """ Initialise object
+
+        :param str path:                The path of the cassette file.
+        :param str mode:                MODE_RECORD or MODE_REPLAY.
+        :param bool realtime:           Wait the recorded response time before a response is replayed.
+        """
+        self.path = path
+        self.mode = mode
+        self.realtime = realtime
+        self._lock = threading.Lock()
+        self._interactions = []
+        self._played = {}
+
+        if mode == MODE_REPLAY or os.path.exists(path):
+            with open(path, 'r') as fdesc:
+                self._interactions = json.load(fdesc).get('interactions', [])
+
+    @classmethod
+    def from_environment(cls):
+        """ Return the cassette that is configured in the environment.
+
+        :rtype: Cassette|None
+        """
+        path = os.environ.get('ADDON_CASSETTE')
+        if not path:
+            return None
+        return cls(path, mode=os.environ.get('ADDON_CASSETTE_MODE', MODE_REPLAY), realtime=os.environ.get('ADDON_CASSETTE_REALTIME') == '1')
+
+    def install(self, session):
+        """ Route all requests of a session through this cassette.
+
+        :type session: requests.Session
+        """
+        _LOGGER.info('Using cassette %s in %s mode', self.path, self.mode)
+        for prefix, adapter in list(session.adapters.items()):
+            session.mount(prefix, CassetteAdapter(self, adapter))
+
+    def record(self, request, response, elapsed):
+        """ Append an interaction to the cassette. The cassette is saved right away, so nothing is lost when Kodi stops the add-on.
+
+        :type request: requests.PreparedRequest
+        :type response: requests.Response
+        :param float elapsed:           The amount of seconds it took to get the response.
+        """
+        try:
+            content = {'text': response.content.decode('utf-8')}
+        except UnicodeDecodeError:
+            content = {'base64': base64.b64encode(response.content).decode('ascii')}
+
+        with self._lock:
+            self._interactions.append(dict(
+                request=dict(method=request.method, url=request.url),
+                response=dict(status=response.status_code, reason=response.reason, headers=dict(response.headers),
+                              elapsed=round(elapsed, 3), **content),
+            ))
+            with open(self.path, 'w') as fdesc:
+                json.dump(dict(interactions=self._interactions), fdesc, indent=2)
+
+    def play(self, request):
+        """ Return the recorded response of a request. Identical requests get the recorded responses in the same order,
+        and the last one is repeated when the request is made more often than it was recorded.
+
+        :type request: requests.PreparedRequest
+        :rtype: dict
+        """
+        key = (request.method, request.url)
+        with self._lock:
+            matches = [interaction for interaction in self._interactions
+                       if (interaction['request']['method'], interaction['request']['url']) == key]
+            if not matches:
+                raise CassetteMissError('No recorded response for %s %s in cassette %s' % (request.method, request.url, self.path), request=request)
+            index = self._played.get(key, 0)
+            self._played[key] = index + 1
+        return matches[min(index, len(matches) - 1)]['response']
+
+
+class CassetteAdapter(BaseAdapter):
+    """ Adapter that records the responses of another adapter, or replays them from a cassette """
+
+    def __init__(self, cassette, adapter):
+        """ Initialise object
+
+        :type cassette: Cassette
+        :param requests.adapters.BaseAdapter adapter:   The adapter that sends the requests to the network.
+        """
+        super(CassetteAdapter, self).__init__()  # pylint: disable=super-with-arguments
+        self._cassette = cassette
+        self._adapter = adapter
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):  # pylint: disable=too-many-arguments
+        """ Sends PreparedRequest object. Returns Response object. """
+        if self._cassette.mode == MODE_RECORD:
+            start = time.time()
+            response = self._adapter.send(request, stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+            self._cassette.record(request, response, time.time() - start)
+            return response
+
+        recorded = self._cassette.play(request)
+        if self._cassette.realtime:
+            time.sleep(recorded.get('elapsed', 0))
+
+        response = Response()
+        response.request = request
+        response.url = request.url
+        response.status_code = recorded['status']
+        response.reason = recorded.get('reason')
+        response.headers = CaseInsensitiveDict(recorded.get('headers', {}))
+        if 'base64' in recorded:
+            response._content = base64.b64decode(recorded['base64'])  # pylint: disable=protected-access
+        else:
+            response._content = recorded.get('text', '').encode('utf-8')  # pylint: disable=protected-access
+        return response
+
+    def close(self):
+        """ Cleans up adapter specific items. """
+        self._adapter.close()
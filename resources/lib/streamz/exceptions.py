@@ -34,3 +34,7 @@ class UnavailableException(Exception):
 
 class LimitReachedException(Exception):
     """ Is thrown when the limit is reached to play an stream. """
+
+
+class NetworkException(Exception):
+    """ Is thrown when the API can't be reached. """
@@ -3,12 +3,11 @@
 
 from __future__ import absolute_import, division, unicode_literals
 
-import json
 import logging
 import os
 
-from resources.lib import kodiutils
-from resources.lib.streamz import API_ENDPOINT, ResolvedStream, util
+from resources.lib import codec, kodiutils
+from resources.lib.streamz import API_ENDPOINT, VIDEOPLAYER_ENDPOINT, ResolvedStream, util
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -100,9 +99,7 @@ class Stream:
         url = API_ENDPOINT + '/%s/play/%s' % (self._mode(), stream_id)
 
         _LOGGER.debug('Getting stream tokens from %s', url)
-        response = util.http_get(url, token=self._tokens.access_token, profile=self._tokens.profile)
-
-        return json.loads(response.text)
+        return util.http_get_json(url, token=self._tokens.access_token, profile=self._tokens.profile)
 
     def _get_video_info(self, strtype, stream_id, player_token):
         """ Get the stream info for the specified stream.
@@ -111,7 +108,7 @@ class Stream:
         :param str player_token:
         :rtype: dict
         """
-        url = 'https://videoplayer-service.api.persgroep.cloud/config/%s/%s' % (strtype, stream_id)
+        url = VIDEOPLAYER_ENDPOINT + '/config/%s/%s' % (strtype, stream_id)
         _LOGGER.debug('Getting video info from %s', url)
         response = util.http_post(url,
                                   params={
@@ -131,7 +128,7 @@ class Stream:
                                       'Authorization': 'Bearer ' + player_token,
                                   })
 
-        info = json.loads(response.text)
+        info = codec.loads(response.content)
         return info
 
     def _send_heartbeat(self, token, correlation_id):
@@ -141,7 +138,7 @@ class Stream:
         :param str correlation_id:      Correlation ID
         :rtype: dict
         """
-        url = 'https://videoplayer-service.api.persgroep.cloud/config/heartbeat'
+        url = VIDEOPLAYER_ENDPOINT + '/config/heartbeat'
         _LOGGER.debug('Sending heartbeat to %s', url)
         util.http_put(url,
                       data={
@@ -3,45 +3,172 @@
 
 from __future__ import absolute_import, division, unicode_literals
 
+import itertools
 import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
 
-import requests
-from requests import HTTPError
-from requests.adapters import BaseAdapter
-
-from resources.lib import kodiutils
-from resources.lib.streamz.exceptions import InvalidTokenException, LimitReachedException, UnavailableException
+from resources.lib import codec, kodilogging, kodiutils
+from resources.lib.streamz import API_ANDROID_ENDPOINT, API_ENDPOINT, LOGIN_ENDPOINT, VIDEOPLAYER_ENDPOINT
+from resources.lib.streamz.exceptions import InvalidTokenException, LimitReachedException, NetworkException, UnavailableException
 
 _LOGGER = logging.getLogger(__name__)
 
 
-class StreamzAdapter(BaseAdapter):
-    """ Fake adapter to handle the calls to streamz:// """
-
-    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
-        """ Sends PreparedRequest object. Returns Response object. """
-        response = requests.Response()
-        response.url = request.url
-        response.status_code = 200
-        return response
-
-    def close(self):
-        """ Cleans up adapter specific items. """
-
-
-# Setup a static session that can be reused for all calls
-SESSION = requests.Session()
-SESSION.headers = {
+# The headers that are sent with all calls
+SESSION_HEADERS = {
     'User-Agent': 'STREAMZ/15.231023 (be.vmma.streamz; build:18041; Android 23) okhttp/4.11.0',
     'x-app-version': '15',
     'x-persgroep-mobile-app': 'true',
     'x-persgroep-os': 'android',
     'x-persgroep-os-version': '28',
 }
-PROXIES = kodiutils.get_proxies()
 
+MAX_WORKERS = 4  # Maximum amount of requests that are sent in parallel by http_get_many
+POOL_MAXSIZE = 10  # Maximum amount of connections that are kept open per host, this covers http_get_many and the background refreshes
+POOL_HOSTS = 4  # Amount of other hosts (like the subtitle CDNs) we keep connections open for
+
+TIMEOUT_CONNECT = 5  # Seconds to wait for a connection
+TIMEOUT_READ = 15  # Seconds to wait for a response
+ROUTE_DEADLINE = 60  # Maximum amount of seconds the requests of a listing can take, including retries
+RETRY_TOTAL = 3  # Maximum amount of retries of a request
+RETRY_BACKOFF = 0.5  # Base delay in seconds between retries, this is doubled after every retry
+RETRY_BACKOFF_MAX = 8  # Maximum delay in seconds between retries
+RETRY_AFTER_MAX = 30  # Maximum delay in seconds we accept from a Retry-After header
+RETRY_STATUS_CODES = [500, 502, 503, 504]  # Status codes that indicate a transient error
+IDEMPOTENT_METHODS = ['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE']  # Methods that are safe to send again
+
+LOG_BODY_MAX = 2048  # Maximum amount of bytes of a response body that are logged
+LOG_SAMPLE_RATE = 10  # Only the body of one in this amount of successful responses is logged, the body of an error is always logged
+
+# Values that should never end up in the log, like tokens and passwords
+REDACT_KEYS = re.compile(r'(token|password|device_code|secret)', re.IGNORECASE)
+REDACT_BODY = re.compile(r'("[\w-]*(?:token|password|device_code|secret)"\s*:\s*")[^"]*', re.IGNORECASE)
+REDACT_JWT = re.compile(r'eyJ[\w-]+(?:\.[\w-]*){0,2}')
+
+_LOCAL = threading.local()  # Contains the deadline of the requests in the current thread
+_LOG_COUNTER = itertools.count()
+
+# The session and the proxy settings are only set up for the first request, since not every route needs the network
+_SESSION_LOCK = threading.Lock()
+
+# The GET requests that are currently in flight, so concurrent callers can share the response
+_FLIGHTS = {}
+_FLIGHTS_LOCK = threading.Lock()
+_COALESCED = [0]
+
+# Refreshes a token that was rejected by the API, the outcome is kept so every token is only refreshed once
+_TOKEN_REFRESHER = None
+_REFRESHED_TOKENS = {}
+_REFRESH_LOCK = threading.Lock()
+
+
+class _Flight:
+    """ A request that is in flight, the outcome is shared with all callers that asked for the same request """
+
+    def __init__(self):
+        """ Initialise object """
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+def get_session():
+    """ Return the session that is reused for all calls. It is created on the first call, so we only import requests when we need it.
+
+    :rtype: requests.Session
+    """
+    if not hasattr(get_session, 'cached'):
+        with _SESSION_LOCK:
+            if not hasattr(get_session, 'cached'):
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                session.headers = dict(SESSION_HEADERS)
+
+                # Every host we talk to gets its own connection pool, so they don't evict each other's connections
+                for endpoint in [API_ENDPOINT, API_ANDROID_ENDPOINT, LOGIN_ENDPOINT, VIDEOPLAYER_ENDPOINT]:
+                    session.mount(endpoint, HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE))
+                session.mount('https://', HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_MAXSIZE))
+
+                # Record or replay all traffic when a cassette is configured
+                if os.environ.get('ADDON_CASSETTE'):
+                    from resources.lib.streamz.cassette import Cassette
+                    Cassette.from_environment().install(session)
+
+                get_session.cached = session
+    return getattr(get_session, 'cached')
+
+
+def get_proxies():
+    """ Return the proxy settings of Kodi. These are read on the first call, and kept for the life of the process.
+
+    :rtype: dict|None
+    """
+    if not hasattr(get_proxies, 'cached'):
+        get_proxies.cached = kodiutils.get_proxies()
+    return getattr(get_proxies, 'cached')
+
+
+@contextmanager
+def deadline(seconds):
+    """ Limit the time that the requests in this block can take in the current thread, including retries.
+
+    :param int seconds:             The amount of seconds from now.
+    """
+    previous = getattr(_LOCAL, 'deadline', None)
+    _LOCAL.deadline = min(previous or float('inf'), time.time() + seconds)
+    try:
+        yield
+    finally:
+        _LOCAL.deadline = previous
 
-def http_get(url, params=None, token=None, profile=None, headers=None):
+
+def _get_deadline():
+    """ Return the time when the requests in the current thread should be finished.
+
+    :rtype: float|None
+    """
+    return getattr(_LOCAL, 'deadline', None)
+
+
+def set_token_refresher(refresher):
+    """ Register the function that refreshes a token when the API replies with a 401 Unauthorized. The request is then sent again with
+    the new token.
+
+    :param callable refresher:      Receives the rejected token, and returns the new token or None when it can't be refreshed.
+    """
+    global _TOKEN_REFRESHER  # pylint: disable=global-statement
+    with _REFRESH_LOCK:
+        _TOKEN_REFRESHER = refresher
+
+
+def _refresh_token(token):
+    """ Return a new token for a token that was rejected by the API. Every token is only refreshed once. Concurrent callers wait for
+    the first one, so a burst of 401's results in only one refresh, and they all get its outcome.
+
+    :param str token:               The rejected token.
+    :rtype: str|None
+    """
+    with _REFRESH_LOCK:
+        if _TOKEN_REFRESHER is None:
+            return None
+        if token not in _REFRESHED_TOKENS:
+            _LOGGER.debug('The token was rejected, refreshing it')
+            try:
+                _REFRESHED_TOKENS[token] = _TOKEN_REFRESHER(token)
+            except Exception as exc:  # pylint: disable=broad-except
+                _LOGGER.warning('Could not refresh the token: %s', exc)
+                _REFRESHED_TOKENS[token] = None
+        return _REFRESHED_TOKENS[token]
+
+
+def http_get(url, params=None, token=None, profile=None, headers=None, validators=None):
     """ Make a HTTP GET request for the specified URL.
 
     :param str url:                 The URL to call.
@@ -49,12 +176,23 @@ def http_get(url, params=None, token=None, profile=None, headers=None):
     :param str token:               The token to use in Bearer authentication.
     :param str profile:             The profile to use in authentication.
     :param dict headers:            A dictionary with additional headers.
+    :param dict validators:         The validators of a cached response, as returned by get_validators(). The API can then reply with
+                                    a 304 Not Modified without a body when the response hasn't changed.
 
     :returns:                       The HTTP Response object.
     :rtype: requests.Response
     """
+    if validators:
+        headers = dict(headers or {})
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators.get('etag')
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators.get('last_modified')
+
+    from requests.exceptions import ConnectionError, HTTPError, Timeout  # pylint: disable=redefined-builtin
     try:
-        return _request('GET', url=url, params=params, token=token, profile=profile, headers=headers)
+        return _single_flight(('GET', url, _freeze(params), profile, _freeze(headers)),
+                              lambda: _request('GET', url=url, params=params, token=token, profile=profile, headers=headers))
     except HTTPError as exc:
         if exc.response.status_code == 401:
             raise InvalidTokenException(exc)
@@ -63,6 +201,137 @@ def http_get(url, params=None, token=None, profile=None, headers=None):
         if exc.response.status_code == 429:
             raise LimitReachedException(exc)
         raise
+    except (ConnectionError, Timeout) as exc:
+        raise NetworkException(exc)
+
+
+def http_get_json(url, params=None, token=None, profile=None, headers=None):
+    """ Make a HTTP GET request for the specified URL, and parse the JSON response. The body is parsed directly from the bytes we received.
+
+    :param str url:                 The URL to call.
+    :param dict params:             The query parameters to include to the URL.
+    :param str token:               The token to use in Bearer authentication.
+    :param str profile:             The profile to use in authentication.
+    :param dict headers:            A dictionary with additional headers.
+
+    :returns:                       The parsed response, or None when the response is empty.
+    """
+    response = http_get(url, params=params, token=token, profile=profile, headers=headers)
+    if not response.content:
+        return None
+    return codec.loads(response.content)
+
+
+def http_get_many(requests_kwargs, max_workers=MAX_WORKERS):
+    """ Make multiple HTTP GET requests in parallel.
+
+    :param list[dict] requests_kwargs:  The arguments of http_get for every request.
+    :param int max_workers:         The maximum amount of requests that are sent in parallel.
+
+    :returns:                       The HTTP Response objects, in the same order as the requests. A request that failed has the
+                                    exception that http_get would have raised instead.
+    :rtype: list[requests.Response|Exception]
+    """
+    def get(kwargs):
+        """ Make one request, and return the exception when it fails. """
+        try:
+            return http_get(**kwargs)
+        except Exception as exc:  # pylint: disable=broad-except
+            return exc
+
+    if len(requests_kwargs) <= 1:
+        return [get(kwargs) for kwargs in requests_kwargs]
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(requests_kwargs))) as executor:
+        return list(executor.map(get, requests_kwargs))
+
+
+def prewarm(urls):
+    """ Open a connection to the specified hosts in the background. The connections are kept alive in the pool, so the requests that
+    follow don't have to wait for the DNS lookup and the TLS handshake anymore.
+
+    :param list[str] urls:          The URLs of the hosts.
+    """
+    def connect(url):
+        """ Open a connection with a request that has no body. We don't care about the response. """
+        from requests import RequestException
+        try:
+            get_session().head(url, proxies=get_proxies(), timeout=(TIMEOUT_CONNECT, TIMEOUT_READ), allow_redirects=False)
+        except RequestException as exc:
+            _LOGGER.debug('Could not prewarm a connection to %s: %s', url, exc)
+
+    for url in urls:
+        thread = threading.Thread(target=connect, args=(url,), name='prewarm-%s' % url)
+        thread.daemon = True
+        thread.start()
+
+
+def get_coalesced_count():
+    """ Return the amount of requests that were not sent because they could share the response of an identical request in flight.
+
+    :rtype: int
+    """
+    return _COALESCED[0]
+
+
+def _freeze(values):
+    """ Convert a dictionary to something we can use in a key.
+
+    :type values: dict|None
+    :rtype: tuple
+    """
+    return tuple(sorted((values or {}).items()))
+
+
+def _single_flight(key, func):
+    """ Execute a request, or wait for the outcome of an identical request that is already in flight.
+
+    :param tuple key:               Identifies the request.
+    :param callable func:           Executes the request.
+    :returns:                       The HTTP Response object.
+    :rtype: requests.Response
+    """
+    with _FLIGHTS_LOCK:
+        flight = _FLIGHTS.get(key)
+        leader = flight is None
+        if leader:
+            flight = _FLIGHTS[key] = _Flight()
+        else:
+            _COALESCED[0] += 1
+
+    if not leader:
+        _LOGGER.debug('Waiting for the response of %s %s that is already in flight', key[0], key[1])
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.response
+
+    try:
+        flight.response = func()
+        return flight.response
+    except Exception as exc:
+        flight.error = exc
+        raise
+    finally:
+        with _FLIGHTS_LOCK:
+            del _FLIGHTS[key]
+        flight.done.set()
+
+
+def get_validators(response):
+    """ Return the validators of a response that can be used to revalidate it later with a conditional request.
+
+    :param requests.Response response:  The response.
+    :returns:                       A dictionary with the ETag and Last-Modified headers, or None when the response has none.
+    :rtype: dict|None
+    """
+    validators = {}
+    if response.headers.get('ETag'):
+        validators['etag'] = response.headers.get('ETag')
+    if response.headers.get('Last-Modified'):
+        validators['last_modified'] = response.headers.get('Last-Modified')
+    return validators or None
 
 
 def http_post(url, params=None, form=None, data=None, token=None, profile=None, headers=None):
@@ -79,6 +348,7 @@ def http_post(url, params=None, form=None, data=None, token=None, profile=None,
     :returns:                       The HTTP Response object.
     :rtype: requests.Response
     """
+    from requests.exceptions import ConnectionError, HTTPError, Timeout  # pylint: disable=redefined-builtin
     try:
         return _request('POST', url=url, params=params, form=form, data=data, token=token, profile=profile, headers=headers)
     except HTTPError as exc:
@@ -89,6 +359,8 @@ def http_post(url, params=None, form=None, data=None, token=None, profile=None,
         if exc.response.status_code == 429:
             raise LimitReachedException(exc)
         raise
+    except (ConnectionError, Timeout) as exc:
+        raise NetworkException(exc)
 
 
 def http_put(url, params=None, form=None, data=None, token=None, profile=None, headers=None):
@@ -105,6 +377,7 @@ def http_put(url, params=None, form=None, data=None, token=None, profile=None, h
     :returns:                       The HTTP Response object.
     :rtype: requests.Response
     """
+    from requests.exceptions import ConnectionError, HTTPError, Timeout  # pylint: disable=redefined-builtin
     try:
         return _request('PUT', url=url, params=params, form=form, data=data, token=token, profile=profile, headers=headers)
     except HTTPError as exc:
@@ -113,6 +386,8 @@ def http_put(url, params=None, form=None, data=None, token=None, profile=None, h
         if exc.response.status_code == 404:
             raise UnavailableException(exc)
         raise
+    except (ConnectionError, Timeout) as exc:
+        raise NetworkException(exc)
 
 
 def http_delete(url, params=None, token=None, profile=None, headers=None):
@@ -127,6 +402,7 @@ def http_delete(url, params=None, token=None, profile=None, headers=None):
     :returns:                       The HTTP Response object.
     :rtype: requests.Response
     """
+    from requests.exceptions import ConnectionError, HTTPError, Timeout  # pylint: disable=redefined-builtin
     try:
         return _request('DELETE', url=url, params=params, token=token, profile=profile, headers=headers)
     except HTTPError as exc:
@@ -135,9 +411,11 @@ def http_delete(url, params=None, token=None, profile=None, headers=None):
         if exc.response.status_code == 404:
             raise UnavailableException(exc)
         raise
+    except (ConnectionError, Timeout) as exc:
+        raise NetworkException(exc)
 
 
-def _request(method, url, params=None, form=None, data=None, token=None, profile=None, headers=None):
+def _request(method, url, params=None, form=None, data=None, token=None, profile=None, headers=None, allow_refresh=True):
     """ Makes a request for the specified URL.
 
     :param str method:              The HTTP Method to use.
@@ -148,16 +426,18 @@ def _request(method, url, params=None, form=None, data=None, token=None, profile
     :param str token:               The token to use in Bearer authentication.
     :param str profile:             The profile to use in authentication.
     :param dict headers:            A dictionary with additional headers.
+    :param bool allow_refresh:      Refresh the token and send the request again when the token is rejected.
 
     :returns:                       The HTTP Response object.
     :rtype: requests.Response
     """
     if form or data:
-        # Make sure we don't log the password
+        # Make sure we don't log the password or tokens
         debug_data = {}
         debug_data.update(form or data)
-        if 'password' in debug_data:
-            debug_data['password'] = '**redacted**'
+        for key in debug_data:
+            if REDACT_KEYS.search(key):
+                debug_data[key] = '**redacted**'
         _LOGGER.debug('Sending %s %s: %s', method, url, debug_data)
     else:
         _LOGGER.debug('Sending %s %s', method, url)
@@ -171,15 +451,171 @@ def _request(method, url, params=None, form=None, data=None, token=None, profile
     if profile:
         headers['x-dpp-profile'] = profile
 
-    response = SESSION.request(method, url, params=params, data=form, json=data, headers=headers, proxies=PROXIES)
+    from requests.exceptions import ConnectionError, Timeout  # pylint: disable=redefined-builtin
+
+    from resources.lib.streamz.cassette import CassetteMissError
+
+    attempt = 0
+    while True:
+        try:
+            response = get_session().request(method, url, params=params, data=form, json=data, headers=headers, proxies=get_proxies(),
+                                             timeout=_get_timeout())
+        except CassetteMissError:
+            # Sending it again won't make a recorded response appear
+            raise
+        except (ConnectionError, Timeout) as exc:
+            # A connection that could not be made is safe to retry, other errors only when the method is idempotent
+            if attempt >= RETRY_TOTAL or not (_is_connect_error(exc) or method in IDEMPOTENT_METHODS):
+                raise
+            delay = _get_backoff(attempt)
+            _LOGGER.debug('Retrying %s %s in %.2f seconds: %s', method, url, delay, exc)
+        else:
+            delay = _get_retry_delay(method, response, attempt)
+            if delay is None:
+                break
+            _LOGGER.debug('Retrying %s %s in %.2f seconds (status=%s)', method, url, delay, response.status_code)
+
+        end = _get_deadline()
+        if end is not None and time.time() + delay >= end:
+            raise Timeout('Deadline exceeded while retrying %s %s' % (method, url))
+        time.sleep(delay)
+        attempt += 1
 
     # Set encoding to UTF-8 if no charset is indicated in http headers (https://github.com/psf/requests/issues/1604)
     if not response.encoding:
         response.encoding = 'utf-8'
 
-    _LOGGER.debug('Got response (status=%s): %s', response.status_code, response.text)
+    _log_response(response)
+
+    # Send the request again with a fresh token when the token was rejected, but only once
+    if response.status_code == 401 and token and allow_refresh and _TOKEN_REFRESHER is not None:
+        new_token = _refresh_token(token)
+        if new_token and new_token != token:
+            _LOGGER.debug('Replaying %s %s with the refreshed token', method, url)
+            return _request(method, url, params=params, form=form, data=data, token=new_token, profile=profile, headers=headers,
+                            allow_refresh=False)
 
     # Raise a generic HTTPError exception when we got an non-okay status code.
     response.raise_for_status()
 
     return response
+
+
+def _log_response(response):
+    """ Log a response. The body is only decoded when debug logging is enabled, and is capped, redacted and sampled to keep it cheap.
+
+    :param requests.Response response:  The response.
+    """
+    sampled = next(_LOG_COUNTER) % LOG_SAMPLE_RATE == 0
+    if not (response.status_code >= 400 or sampled) or not kodilogging.is_debug_enabled():
+        _LOGGER.debug('Got response (status=%s, %d bytes)', response.status_code, len(response.content))
+        return
+
+    _LOGGER.debug('Got response (status=%s, %d bytes): %s', response.status_code, len(response.content), _format_body(response.content))
+
+
+def _format_body(content):
+    """ Format a response body for the log.
+
+    :param bytes content:           The body of the response.
+    :returns:                       The start of the body, without tokens and passwords.
+    :rtype: str
+    """
+    body = content[:LOG_BODY_MAX].decode('utf-8', 'replace')
+    body = REDACT_JWT.sub('**redacted**', REDACT_BODY.sub(r'\1**redacted**', body))
+    if len(content) > LOG_BODY_MAX:
+        body += '... (%d more bytes)' % (len(content) - LOG_BODY_MAX)
+    return body
+
+
+def _get_timeout():
+    """ Return the connect and read timeout for a request, shortened to respect the deadline.
+
+    :rtype: tuple[float, float]
+    """
+    end = _get_deadline()
+    if end is None:
+        return TIMEOUT_CONNECT, TIMEOUT_READ
+
+    from requests.exceptions import Timeout
+
+    remaining = end - time.time()
+    if remaining <= 0:
+        raise Timeout('Deadline exceeded')
+    return min(TIMEOUT_CONNECT, remaining), min(TIMEOUT_READ, remaining)
+
+
+def _is_connect_error(exc):
+    """ Check if a request failed before a connection was made, like a connect timeout, a refused connection or a failed DNS lookup.
+    The server can't have received such a request.
+
+    :type exc: requests.exceptions.RequestException
+    :rtype: bool
+    """
+    from requests.exceptions import ConnectTimeout
+    from urllib3.exceptions import ConnectTimeoutError
+
+    if isinstance(exc, ConnectTimeout):
+        return True
+    # Requests wraps the error of urllib3, a NewConnectionError is a ConnectTimeoutError too
+    reason = getattr(exc.args[0], 'reason', None) if exc.args else None
+    return isinstance(reason, ConnectTimeoutError)
+
+
+def _get_backoff(attempt):
+    """ Return the delay before the next retry, using exponential backoff with full jitter.
+
+    :param int attempt:             The amount of retries that have been done already.
+    :rtype: float
+    """
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** attempt))
+
+
+def _get_retry_delay(method, response, attempt):
+    """ Return the delay before the request should be retried, or None when the response should not be retried.
+
+    :param str method:              The HTTP Method that was used.
+    :param requests.Response response:  The response.
+    :param int attempt:             The amount of retries that have been done already.
+    :rtype: float|None
+    """
+    if attempt >= RETRY_TOTAL:
+        return None
+
+    retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+
+    # A 429 is also used when the maximum amount of streams is reached, so we only retry when the server tells us when to do so.
+    # The request was not processed, so this is also safe for methods that are not idempotent.
+    if response.status_code == 429:
+        if retry_after is None or retry_after > RETRY_AFTER_MAX:
+            return None
+        return retry_after
+
+    if response.status_code in RETRY_STATUS_CODES and method in IDEMPOTENT_METHODS:
+        if retry_after is not None:
+            return min(retry_after, RETRY_AFTER_MAX)
+        return _get_backoff(attempt)
+
+    return None
+
+
+def _parse_retry_after(value):
+    """ Parse the value of a Retry-After header, this can be an amount of seconds or a HTTP date.
+
+    :param str value:               The value of the header.
+    :returns:                       The amount of seconds to wait, or None when the value can't be parsed.
+    :rtype: float|None
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    from email.utils import mktime_tz, parsedate_tz
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0.0, mktime_tz(parsed) - time.time())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Micro-benchmark of the JSON codecs on storefront payloads.
+
+Usage: scripts/benchmark_json.py [payload.json ...]
+
+Without arguments, a synthetic storefront with the structure of the API is used. Pass recorded responses to benchmark real payloads.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+import os
+import sys
+import timeit
+
+ROUNDS = 50
+
+
+def synthetic_storefront(rows=20, teasers=40):
+    """ Build a storefront payload like the API returns. """
+    return json.dumps({
+        'rows': [{
+            'id': 'row-%d' % row,
+            'title': 'Swimlane %d' % row,
+            'rowType': 'SWIMLANE_DEFAULT',
+            'teasers': [{
+                'title': 'Programma %d-%d met een wat langere titel' % (row, teaser),
+                'imageUrl': 'https://images.streamz.be/%d/%d/landscape.jpg' % (row, teaser),
+                'target': {
+                    'type': 'PROGRAM' if teaser % 3 else 'MOVIE',
+                    'id': '%08d-0000-4000-8000-%012d' % (row, teaser),
+                },
+                'label': None,
+                'description': 'Een beschrijving van het programma, met wat accenten: één, café, naïef.' * 2,
+            } for teaser in range(teasers)],
+        } for row in range(rows)],
+    }).encode('utf-8')
+
+
+def backends():
+    """ Return the JSON backends that are available, as (name, loads, dumps) tuples. """
+    result = [('json', json.loads, lambda data: json.dumps(data, separators=(',', ':')))]
+    try:
+        import ujson
+        result.append(('ujson', ujson.loads, lambda data: ujson.dumps(data, ensure_ascii=False)))
+    except ImportError:
+        pass
+    try:
+        import orjson
+        result.append(('orjson', orjson.loads, lambda data: orjson.dumps(data).decode('utf-8')))  # pylint: disable=no-member
+    except ImportError:
+        pass
+    return result
+
+
+def benchmark(name, content):
+    """ Benchmark the decoding of one payload. """
+    print('%s (%d KB)' % (name, len(content) // 1024))
+
+    # The old code path: decode the bytes to text, and parse the text
+    baseline = min(timeit.repeat(lambda: json.loads(content.decode('utf-8')), number=ROUNDS, repeat=3)) / ROUNDS
+    print('  %-32s %8.3f ms' % ('json.loads(response.text)', baseline * 1000))
+
+    data = json.loads(content)
+    for backend, loads, dumps in backends():
+        parse = min(timeit.repeat(lambda: loads(content), number=ROUNDS, repeat=3)) / ROUNDS  # pylint: disable=cell-var-from-loop
+        cached = dumps(data)
+        roundtrip = min(timeit.repeat(lambda: loads(dumps(data)), number=ROUNDS, repeat=3)) / ROUNDS  # pylint: disable=cell-var-from-loop
+        print('  %-32s %8.3f ms (%.1fx)   cache write+read %8.3f ms   cached size %d KB' % (
+            backend + '.loads(response.content)', parse * 1000, baseline / parse, roundtrip * 1000, len(cached) // 1024))
+
+
+def main():
+    """ Run the benchmark. """
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from resources.lib import codec
+    print('The add-on uses the %s codec' % codec.NAME)
+
+    if len(sys.argv) > 1:
+        for filename in sys.argv[1:]:
+            with open(filename, 'rb') as fdesc:
+                benchmark(os.path.basename(filename), fdesc.read())
+    else:
+        benchmark('synthetic storefront', synthetic_storefront())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Benchmark of the memory use and construction time of the episode models.
+
+Usage: scripts/benchmark_models.py [amount]
+
+Builds 50000 episodes (or the specified amount) from synthetic season payloads, with the models of the add-on and with a copy of
+the previous __dict__ based Episode class.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import gc
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+EPISODES = 50000
+EPISODES_PER_SEASON = 25
+
+
+class LegacyEpisode:
+    """ The Episode class before it used slots, and the way it was built by Api._parse_season """
+
+    def __init__(self, episode_id=None, program_id=None, program_name=None, number=None, season=None, name=None, description=None, poster=None,
+                 thumb=None, fanart=None, duration=None, remaining=None, geoblocked=None, channel=None, legal=None, aired=None, progress=None,
+                 watched=False, next_episode=None, available=True):
+        self.episode_id = episode_id
+        self.program_id = program_id
+        self.program_name = program_name
+        self.number = int(number) if number else None
+        self.season = int(season) if season else None
+        if number:
+            self.name = re.compile('^%d. ' % number).sub('', name)
+        else:
+            self.name = name
+        self.description = description if description else ''
+        self.poster = poster
+        self.thumb = thumb
+        self.fanart = fanart
+        self.duration = int(duration) if duration else None
+        self.remaining = int(remaining) if remaining is not None else None
+        self.geoblocked = geoblocked
+        self.channel = channel
+        self.legal = legal
+        self.aired = aired
+        self.progress = progress
+        self.watched = watched
+        self.next_episode = next_episode
+        self.available = available
+
+    @staticmethod
+    def parse_channel(url):
+        """ The previous Api._parse_channel. """
+        if not url:
+            return None
+        return str(os.path.basename(url).split('-')[0])
+
+    @classmethod
+    def from_api_json(cls, data, program, season_index):
+        """ The previous Api._parse_season, for one episode. """
+        return cls(
+            episode_id=data.get('id'),
+            program_id=program.get('id'),
+            program_name=program.get('name'),
+            number=data.get('index'),
+            season=season_index,
+            name=data.get('name'),
+            description=data.get('description'),
+            duration=data.get('durationSeconds'),
+            thumb=data.get('imageUrl'),
+            fanart=data.get('imageUrl'),
+            geoblocked=program.get('blockedFor') == 'GEO',
+            remaining=data.get('remainingDaysAvailable'),
+            channel=cls.parse_channel(program.get('channelLogoUrl')),
+            legal=program.get('legalIcons'),
+            aired=data.get('broadcastTimestamp'),
+            progress=data.get('playerPositionSeconds', 0),
+            watched=data.get('doneWatching', False),
+            available=data.get('blockedFor') != 'SUBSCRIPTION',
+        )
+
+
+def synthetic_seasons(amount):
+    """ Build the program and season payloads like the API returns, every program has its own copy of the decoded json. """
+    for offset in range(0, amount, EPISODES_PER_SEASON):
+        program = {
+            'id': '%036d' % (offset // 250),
+            'name': 'Programma %d' % (offset // 250),
+            'channelLogoUrl': 'https://images.streamz.be/channels/vtm-white.png',
+            'legalIcons': ['AL', 'GEWELD'],
+            'seasonIndices': list(range(1, 11)),
+        }
+        season = {
+            'episodes': [{
+                'id': '%08d-0000-4000-8000-%012d' % (offset, index),
+                'index': index,
+                'name': '%d. Aflevering %d' % (index, index),
+                'description': 'Beschrijving van aflevering %d' % index,
+                'durationSeconds': 2700,
+                'imageUrl': 'https://images.streamz.be/%d/%d.jpg' % (offset, index),
+                'remainingDaysAvailable': 120,
+                'broadcastTimestamp': '2020-01-01T20:00:00Z',
+                'playerPositionSeconds': 0,
+                'doneWatching': False,
+            } for index in range(1, EPISODES_PER_SEASON + 1)],
+        }
+        yield program, offset // EPISODES_PER_SEASON % 10 + 1, season
+
+
+def benchmark(name, build, payloads):
+    """ Build all episodes, and report the time it took and the memory they use. Memory is traced in a separate run, since tracing
+    slows down the construction. """
+    def build_all():
+        """ Build the episodes of all seasons. """
+        return [build(item, program, season_index) for program, season_index, season in payloads for item in season['episodes']]
+
+    gc.collect()
+    start = time.time()
+    episodes = build_all()
+    elapsed = time.time() - start
+    del episodes
+
+    gc.collect()
+    tracemalloc.start()
+    episodes = build_all()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('  %-16s %8.1f ms %8.1f MB   %5d bytes per episode' % (name, elapsed * 1000, size / 1024 / 1024, size // len(episodes)))
+    return elapsed, size
+
+
+def main():
+    """ Run the benchmark. """
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from resources.lib.streamz import Episode, Program
+
+    amount = int(sys.argv[1]) if len(sys.argv) > 1 else EPISODES
+    payloads = list(synthetic_seasons(amount))
+    print('Building %d episodes' % amount)
+
+    legacy_time, legacy_size = benchmark('__dict__', LegacyEpisode.from_api_json, payloads)
+    programs = {}
+    for program, _, _ in payloads:
+        programs.setdefault(program['id'], Program.from_api_json(program))
+    slots_time, slots_size = benchmark('__slots__', Episode.from_api_json,
+                                       [(programs[program['id']], season_index, season) for program, season_index, season in payloads])
+    print('  %.1fx faster, %.0f%% less memory' % (legacy_time / slots_time, 100 - 100 * slots_size / legacy_size))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,14 +5,25 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import json
 import os
+import threading
+import time
 import unittest
 
 from resources.lib import kodiutils
-from resources.lib.streamz import STOREFRONT_MAIN, STOREFRONT_MOVIES, STOREFRONT_PAGE_CONTINUE_WATCHING, STOREFRONT_SERIES, Episode, Movie, Program
-from resources.lib.streamz.api import Api
-from resources.lib.streamz.auth import Auth
-from resources.lib.streamz.exceptions import UnavailableException
+from resources.lib.streamz import (SNAPSHOT_VERSION, STOREFRONT_MAIN, STOREFRONT_MOVIES, STOREFRONT_PAGE_CONTINUE_WATCHING, STOREFRONT_SERIES,
+                                   Episode, Movie, Program, Season)
+from resources.lib.streamz.api import CACHE_ONLY, CACHE_PREVENT, Api, _get_hydrate_executor
+from resources.lib.streamz.auth import AccountStorage, Auth
+from resources.lib.streamz.exceptions import NetworkException, UnavailableException
+from tests.test_cache import use_temporary_cache
+from tests.test_util import reset_session
+
+try:  # Python 3
+    from unittest import mock
+except ImportError:  # Python 2
+    import mock
 
 EXAMPLE_MOVIE = 'f384c9f1-e2dc-4f82-9954-a3f91589385a'  # Niet schieten
 EXAMPLE_PROGRAM = '6382e070-c284-4538-b60a-44f337ba6157'  # FC De Kampioenen
@@ -77,5 +88,320 @@ class TestApi(unittest.TestCase):
             self.api.get_episode('0')
 
 
+class FakeResponse:
+    """ Minimal stand-in for a requests.Response """
+
+    def __init__(self, data, status_code=200, headers=None):
+        self.text = json.dumps(data) if data is not None else ''
+        self.content = self.text.encode('utf-8')
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeApi:
+    """ Serves program details and seasons without network access """
+
+    def __init__(self, program_id, seasons):
+        self.program_id = program_id
+        self.seasons = seasons
+        self.name = 'Example program'
+        self.calls = []
+        self.etags = True
+        self.not_modified = 0
+        self.offline = False
+        self.delays = {}
+        self.lock = threading.Lock()
+
+    def http_get(self, url, validators=None, **kwargs):  # pylint: disable=unused-argument
+        with self.lock:
+            self.calls.append(url)
+
+        if self.offline:
+            raise NetworkException('Network is unreachable')
+
+        for path, delay in self.delays.items():
+            if url.endswith(path):
+                time.sleep(delay)
+
+        if '?selectedSeasonIndex=' in url:
+            season = int(url.split('=')[-1])
+            time.sleep(0.01 * (self.seasons - season))  # Make later seasons complete first
+            return FakeResponse({
+                'selectedSeason': {
+                    'episodes': [
+                        {'id': '%s-%d-%d' % (self.program_id, season, episode), 'index': episode, 'name': 'Episode %d' % episode,
+                         'description': 'Description %d-%d' % (season, episode)}
+                        for episode in range(1, 4)
+                    ],
+                },
+            })
+
+        etag = '"%s-%d"' % (self.name, self.seasons)
+        if validators and validators.get('etag') == etag:
+            self.not_modified += 1
+            return FakeResponse(None, status_code=304)
+
+        return FakeResponse({
+            'id': self.program_id,
+            'name': self.name,
+            'channelLogoUrl': 'https://images.streamz.be/channels/vtm-white.png',
+            'legalIcons': ['AL', '12'],
+            'seasonIndices': list(range(1, self.seasons + 1)),
+        }, headers={'ETag': etag} if self.etags else None)
+
+
+class TestApiOffline(unittest.TestCase):
+    """ Tests for Streamz API that run without network access """
+
+    def setUp(self):
+        use_temporary_cache(self)
+        tokens = AccountStorage()
+        tokens.product = 'STREAMZ'
+        self.api = Api(tokens, max_workers=3)
+        self.fake = FakeApi(EXAMPLE_PROGRAM, 12)
+        patcher = mock.patch('resources.lib.streamz.util.http_get', side_effect=self.fake.http_get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_program_seasons(self):
+        program = self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT)
+        self.assertEqual(list(program.seasons.keys()), list(range(1, 13)))
+        for number, season in program.seasons.items():
+            self.assertEqual(season.number, number)
+            self.assertEqual([e.episode_id for e in season.episodes.values()],
+                             ['%s-%d-%d' % (EXAMPLE_PROGRAM, number, episode) for episode in range(1, 4)])
+        self.assertEqual(len(self.fake.calls), 13)
+
+    def test_get_program_lazy_seasons(self):
+        program = self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT)
+        self.assertEqual(len(program.seasons), 12)
+        self.assertEqual(len(self.fake.calls), 1)
+
+        # Only the requested season is fetched, and only once
+        self.assertEqual(program.seasons[5].number, 5)
+        self.assertEqual(program.seasons[5].number, 5)
+        self.assertEqual(len(self.fake.calls), 2)
+
+        # A new instance uses the cached detail and season
+        program = self.api.get_program(EXAMPLE_PROGRAM)
+        self.assertEqual(len(program.seasons[5].episodes), 3)
+        self.assertEqual(len(self.fake.calls), 2)
+
+    def test_get_program_incremental_refresh(self):
+        self.fake.etags = False
+        list(self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT).seasons.values())
+        self.assertEqual(len(self.fake.calls), 13)
+        del self.fake.calls[:]
+
+        # Refreshing only fetches the season that is still airing
+        self.assertEqual(len(self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT).seasons.values()), 12)
+        self.assertEqual(len(self.fake.calls), 2)
+        self.assertTrue(self.fake.calls[1].endswith('selectedSeasonIndex=12'))
+        del self.fake.calls[:]
+
+        # A new season has started, the previous season is fetched one last time
+        self.fake.seasons = 13
+        self.assertEqual(len(self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT).seasons.values()), 13)
+        self.assertEqual(sorted(call.split('=')[-1] for call in self.fake.calls[1:]), ['12', '13'])
+
+    def test_conditional_get(self):
+        list(self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT).seasons.values())
+        del self.fake.calls[:]
+
+        # The program hasn't changed, so the cached version is reused and the open season stays cached
+        self.assertEqual(len(self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT).seasons.values()), 12)
+        self.assertEqual(self.fake.not_modified, 1)
+        self.assertEqual(len(self.fake.calls), 1)
+
+        # The program has changed
+        self.fake.name = 'Renamed program'
+        self.assertEqual(self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT).name, 'Renamed program')
+        self.assertEqual(self.fake.not_modified, 1)
+
+    def test_stale_while_revalidate(self):
+        self.api.get_program(EXAMPLE_PROGRAM)
+        self.fake.name = 'Renamed program'
+
+        # Pretend that the program has expired
+        with mock.patch('resources.lib.cache.time.time', return_value=time.time() + 7200):
+            # We get the expired program immediately, and only one refresh is started
+            self.assertEqual(self.api.get_program(EXAMPLE_PROGRAM).name, 'Example program')
+            self.api.get_program(EXAMPLE_PROGRAM)
+            for thread in threading.enumerate():
+                if thread.name.startswith('refresh-'):
+                    thread.join()
+
+            self.assertEqual(self.api.get_program(EXAMPLE_PROGRAM).name, 'Renamed program')
+            self.assertEqual(len(self.fake.calls), 2)
+
+    def test_episode_navigation(self):
+        program = self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT)
+        episode = self.api.get_episode_from_program(program, '%s-5-3' % EXAMPLE_PROGRAM)
+        self.assertEqual((episode.season, episode.number), (5, 3))
+        self.assertIsNone(program.get_episode('unknown'))
+
+        # The next episode can be in the next season
+        self.assertEqual(self.api.get_next_episode_from_program(program, 5, 2).episode_id, '%s-5-3' % EXAMPLE_PROGRAM)
+        self.assertEqual(self.api.get_next_episode_from_program(program, 5, 3).episode_id, '%s-6-1' % EXAMPLE_PROGRAM)
+        self.assertIsNone(self.api.get_next_episode_from_program(program, 12, 3))
+        self.assertEqual(program.get_previous_episode(6, 1).episode_id, '%s-5-3' % EXAMPLE_PROGRAM)
+        self.assertIsNone(program.get_previous_episode(1, 1))
+
+        # Gaps in the numbering are skipped
+        program = Program(seasons={
+            season: Season(number=season, episodes={
+                number: Episode(episode_id='%d-%d' % (season, number), season=season, number=number, name='') for number in numbers
+            }) for season, numbers in [(1, [1, 2, 4]), (3, [2])]
+        })
+        self.assertEqual(program.get_next_episode(1, 2).episode_id, '1-4')
+        self.assertEqual(program.get_next_episode(1, 4).episode_id, '3-2')
+        self.assertEqual(program.get_previous_episode(3, 2).episode_id, '1-4')
+
+    def test_models(self):
+        program = self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT)
+        first, last = program.seasons[1].episodes[1], program.seasons[12].episodes[3]
+        self.assertEqual(first.name, 'Episode 1')
+        self.assertFalse(hasattr(first, '__dict__'))
+
+        # Repeated values are shared, even when they come from separate responses
+        self.assertEqual(last.legal, ('AL', '12'))
+        self.assertIs(first.legal, last.legal)
+        self.assertIs(first.channel, Program.from_api_json(dict(channelLogoUrl='https://images.streamz.be/vtm-logo.png')).channel)
+
+    def test_snapshots(self):
+        program = self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT)
+        self.assertEqual(len(program.seasons[5].episodes), 3)
+
+        # The cache contains snapshots of the models, that are restored as they were
+        snapshot = kodiutils.get_cache(['program', 'v%s' % SNAPSHOT_VERSION, EXAMPLE_PROGRAM])
+        self.assertEqual(Program.from_snapshot(snapshot).seasons.keys(), list(range(1, 13)))
+        season = Season.from_snapshot(kodiutils.get_cache(['season', 'v%s' % SNAPSHOT_VERSION, EXAMPLE_PROGRAM, '5']))
+        self.assertEqual(repr(season), repr(program.seasons[5]))
+        self.assertIs(season.legal, program.legal)
+
+        # Snapshots of another version are not used
+        kodiutils.invalidate_cache()
+        kodiutils.set_cache(['program', EXAMPLE_PROGRAM], snapshot)
+        self.assertIsNone(self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_ONLY))
+
+    def test_hydrate(self):
+        self.api = Api(self.api._tokens, hydrate=True)  # pylint: disable=protected-access
+        self.fake.delays['/slow'] = 0.5
+        teasers = [
+            dict(target=dict(type='PROGRAM', id=EXAMPLE_PROGRAM), title='Teaser'),
+            dict(target=dict(type='MOVIE', id='slow'), title='Slow movie'),
+        ]
+
+        # The details that are fetched in time are used, the others are finished in the background
+        with mock.patch('resources.lib.streamz.api.HYDRATE_BUDGET', 0.2):
+            program, movie = self.api._parse_teasers(teasers)  # pylint: disable=protected-access,unbalanced-tuple-unpacking
+        self.assertEqual(program.name, 'Example program')
+        self.assertEqual(movie.name, 'Slow movie')
+        _get_hydrate_executor().shutdown(wait=True)
+        del _get_hydrate_executor.cached
+        self.assertIsNotNone(self.api.get_movie('slow', cache=CACHE_ONLY))
+
+        # Without the setting, we only use the cache
+        del self.fake.calls[:]
+        self.api = Api(self.api._tokens)  # pylint: disable=protected-access
+        movie = self.api._parse_teasers([dict(target=dict(type='MOVIE', id='other'), title='Other')])[0]  # pylint: disable=protected-access
+        self.assertEqual(movie.name, 'Other')
+        self.assertEqual(self.fake.calls, [])
+
+    def test_offline(self):
+        # Nothing is cached yet
+        self.fake.offline = True
+        with self.assertRaises(NetworkException):
+            self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT)
+
+        # Populate the cache
+        self.fake.offline = False
+        list(self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT).seasons.values())
+        del self.fake.calls[:]
+
+        # The cached program is returned, and we stop trying the network once we know it's unreachable
+        self.fake.offline = True
+        program = self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT)
+        self.assertTrue(self.api.offline)
+        self.assertEqual(len(program.seasons[12].episodes), 3)
+        self.assertEqual(len(self.fake.calls), 1)
+
+    def test_offline_season(self):
+        # Only the first season is cached
+        self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT).seasons[1]  # pylint: disable=expression-not-assigned
+
+        # A season that isn't cached can't be shown offline, the route then shows that Streamz can't be reached
+        self.fake.offline = True
+        program = self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT)
+        self.assertEqual(len(program.seasons[1].episodes), 3)
+        self.assertIn(2, program.seasons)
+        with self.assertRaises(NetworkException):
+            program.seasons[2]  # pylint: disable=pointless-statement
+        self.assertEqual([season.number for season in program.seasons.values()], [1])
+
+    def test_cache_only_without_http(self):
+        # Nothing is cached yet
+        self.assertIsNone(self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_ONLY))
+        self.assertEqual(self.fake.calls, [])
+
+        # Populate the cache
+        list(self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT).seasons.values())
+        del self.fake.calls[:]
+
+        # Build teasers from the cache only, with one read for the details and one for the seasons of the episodes
+        teasers = [
+            dict(target=dict(type='PROGRAM', id=EXAMPLE_PROGRAM)),
+            dict(target=dict(type='EPISODE', id='%s-12-3' % EXAMPLE_PROGRAM, programId=EXAMPLE_PROGRAM)),
+            dict(target=dict(type='MOVIE', id=EXAMPLE_MOVIE), title='Niet schieten'),
+        ]
+        with mock.patch('resources.lib.kodiutils.get_cache_many', wraps=kodiutils.get_cache_many) as get_cache_many, \
+                mock.patch('resources.lib.kodiutils.get_cache', wraps=kodiutils.get_cache) as get_cache:
+            program, episode, movie = self.api._parse_teasers(teasers)  # pylint: disable=protected-access,unbalanced-tuple-unpacking
+            self.assertEqual(len(program.seasons), 12)
+            self.assertEqual(episode.description, 'Description 12-3')
+            self.assertEqual(movie.name, 'Niet schieten')
+        self.assertEqual(get_cache_many.call_count, 2)
+        self.assertEqual(get_cache.call_count, 0)
+        self.assertEqual(self.fake.calls, [])
+
+        # The seasons that are not cached are not looked up again for every episode
+        kodiutils.invalidate_cache()
+        self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT).seasons[12]  # pylint: disable=expression-not-assigned
+        del self.fake.calls[:]
+        with mock.patch('resources.lib.kodiutils.get_cache_many', wraps=kodiutils.get_cache_many) as get_cache_many:
+            teasers = [dict(target=dict(type='EPISODE', id='%s-12-%d' % (EXAMPLE_PROGRAM, number), programId=EXAMPLE_PROGRAM)) for number in [1, 2, 3]]
+            episodes = self.api._parse_teasers(teasers)  # pylint: disable=protected-access
+            self.assertEqual([episode.description for episode in episodes], ['Description 12-1', 'Description 12-2', 'Description 12-3'])
+        self.assertEqual(get_cache_many.call_count, 2)
+        self.assertEqual(self.fake.calls, [])
+
+
+class TestApiCassette(unittest.TestCase):
+    """ Tests for Streamz API that replay recorded responses through the HTTP layer """
+
+    def setUp(self):
+        use_temporary_cache(self)
+        reset_session()
+        self.addCleanup(reset_session)
+        patcher = mock.patch.dict(os.environ, {'ADDON_CASSETTE': os.path.join(os.path.dirname(__file__), 'cassettes', 'program.json')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        tokens = AccountStorage()
+        tokens.product = 'STREAMZ'
+        self.api = Api(tokens)
+
+    def test_get_program(self):
+        program = self.api.get_program(EXAMPLE_PROGRAM, cache=CACHE_PREVENT)
+        self.assertEqual(program.name, 'FC De Kampioenen')
+        self.assertEqual(program.channel, 'vtm')
+        self.assertEqual([(season.number, len(season.episodes)) for season in program.seasons.values()], [(1, 2), (2, 2)])
+        self.assertEqual(program.seasons[2].episodes[1].name, 'Aflevering 1')
+
+    def test_errors(self):
+        with self.assertRaises(UnavailableException):
+            self.api.get_program('0')
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+""" Tests for the cache """
+
+# pylint: disable=missing-docstring,no-self-use
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from resources.lib import kodiutils
+from resources.lib.cache import EVICTION_INTERVAL, NO_EXPIRY, CacheStore, MemoryCache
+
+
+def use_temporary_cache(test):
+    """ Use an empty cache database in a temporary directory during a test, so the tests don't leave a database in the tree """
+    path = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, path, ignore_errors=True)
+
+    previous = getattr(kodiutils.get_cache_store, 'cached', None)
+    kodiutils.get_cache_store.cached = CacheStore(os.path.join(path, 'cache.sqlite'))
+
+    def restore():
+        if previous is None:
+            del kodiutils.get_cache_store.cached
+        else:
+            kodiutils.get_cache_store.cached = previous
+    test.addCleanup(restore)
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        use_temporary_cache(self)
+
+    def test_get_set(self):
+        self.assertIsNone(kodiutils.get_cache(['test', 'key']))
+
+        kodiutils.set_cache(['test', 'key'], {'value': [1, 2, 3]})
+        self.assertEqual(kodiutils.get_cache(['test', 'key']), {'value': [1, 2, 3]})
+
+        kodiutils.set_cache(['test', 'key'], None)
+        self.assertIsNone(kodiutils.get_cache(['test', 'key']))
+
+    def test_ttl(self):
+        kodiutils.set_cache(['test', 'expired'], 'value', ttl=-1)
+        self.assertIsNone(kodiutils.get_cache(['test', 'expired']))
+
+        kodiutils.set_cache(['test', 'key'], 'value')
+        self.assertEqual(kodiutils.get_cache(['test', 'key'], ttl=60), 'value')
+
+        # Only remove items that are older than a minute
+        kodiutils.invalidate_cache(ttl=60)
+        self.assertEqual(kodiutils.get_cache(['test', 'key']), 'value')
+
+    def test_ttl_policy(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+
+        store = CacheStore(os.path.join(path, 'cache.sqlite'), ttl_policy={'short': -1})
+        store.set('short.key', 'value')
+        store.set('other.key', 'value')
+
+        # The ttl of the namespace is used, unless a ttl is specified
+        self.assertIsNone(store.get('short.key'))
+        self.assertEqual(store.get('short.key', ttl=NO_EXPIRY), 'value')
+        self.assertEqual(store.get('other.key'), 'value')
+        self.assertEqual(store.get_many(['short.key', 'other.key']), {'other.key': 'value'})
+
+    def test_validators(self):
+        kodiutils.set_cache(['test', 'expired'], 'value', ttl=-1, validators={'etag': '"1"'})
+        self.assertIsNone(kodiutils.get_cache(['test', 'expired']))
+
+        # The validators are returned regardless of the age of the item
+        self.assertEqual(kodiutils.get_cache_validators(['test', 'expired']), ('value', {'etag': '"1"'}))
+
+        # The item is fresh again after it has been revalidated
+        kodiutils.touch_cache(['test', 'expired'])
+        self.assertEqual(kodiutils.get_cache(['test', 'expired']), 'value')
+
+    def test_many(self):
+        kodiutils.set_cache_many([(['test', str(i)], i) for i in range(1200)])
+        result = kodiutils.get_cache_many([['test', str(i)] for i in range(0, 1300, 2)])
+        self.assertEqual(len(result), 600)
+        self.assertEqual(result[('test', '1198')], 1198)
+
+    def test_threads(self):
+        def worker(index):
+            kodiutils.set_cache(['test', 'thread', str(index)], index)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(kodiutils.get_cache_many([['test', 'thread', str(i)] for i in range(8)])), 8)
+
+    def test_memory_invalidation(self):
+        kodiutils.set_cache(['test', 'key'], 'old')
+        self.assertEqual(kodiutils.get_cache(['test', 'key']), 'old')
+
+        kodiutils.set_cache(['test', 'key'], 'new')
+        self.assertEqual(kodiutils.get_cache(['test', 'key']), 'new')
+
+        kodiutils.invalidate_cache()
+        self.assertIsNone(kodiutils.get_cache(['test', 'key']))
+
+    def test_memory_lru(self):
+        memory = MemoryCache(max_entries=3, max_size=100)
+        for key in ['a', 'b', 'c']:
+            memory.set(key, key.upper(), 10)
+
+        # Use "a", so "b" becomes the least recently used item
+        self.assertEqual(memory.get('a'), 'A')
+        memory.set('d', 'D', 10)
+        self.assertIsNone(memory.get('b'))
+        self.assertEqual(memory.get('a'), 'A')
+
+        # Evict items when we are over the size limit
+        memory.set('e', 'E', 85)
+        self.assertIsNone(memory.get('c'))
+        self.assertIsNone(memory.get('d'))
+        self.assertEqual(memory.get('a'), 'A')
+        self.assertEqual(memory.get('e'), 'E')
+
+        # Items that are too large are not stored
+        memory.set('f', 'F', 101)
+        self.assertIsNone(memory.get('f'))
+
+    def test_eviction(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+
+        # Every item is 102 bytes when serialized, so only 9 items fit in the budget
+        store = CacheStore(os.path.join(path, 'cache.sqlite'), memory=MemoryCache(max_entries=0), max_size=1000)
+        keys = ['item%02d' % i for i in range(EVICTION_INTERVAL - 1)]
+        for key in keys:
+            store.set(key, 'x' * 100)
+        store.get('item00')  # This is the most recently used item now
+        store.set('last', 'x' * 100)
+
+        # Eviction runs in batches, the rest is evicted on the next write
+        store.evict()
+        store.set('last', 'x' * 100)
+        self.assertEqual(sorted(store.get_many(keys + ['last'])), ['item00', 'item92', 'item93', 'item94', 'item95', 'item96', 'item97', 'item98', 'last'])
+
+    def test_flush(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        database = os.path.join(path, 'cache.sqlite')
+
+        store = CacheStore(database)
+        store.set_many({'first': 1, 'second': 2})
+        connection = sqlite3.connect(database, isolation_level=None)
+        self.addCleanup(connection.close)
+        connection.execute('UPDATE cache SET accessed = 0')
+
+        # The access times of a route that only reads are written when it flushes them
+        store.get('first')
+        store.flush()
+        self.assertEqual(connection.execute('SELECT key FROM cache WHERE accessed > 0').fetchall(), [('first',)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,7 +12,12 @@ import unittest
 import xbmc
 
 from resources.lib import addon
-from resources.lib.streamz import STOREFRONT_MAIN
+from resources.lib.streamz import STOREFRONT_MAIN, util
+
+try:  # Python 3
+    from unittest import mock
+except ImportError:  # Python 2
+    import mock
 
 routing = addon.routing  # pylint: disable=invalid-name
 
@@ -72,5 +77,38 @@ class TestRouting(unittest.TestCase):
         routing.run([routing.url_for(addon.play, category='episodes', item=EXAMPLE_EPISODE), '0', ''])
 
 
+
+class TestRoutingDeadline(unittest.TestCase):
+    """ Tests for the deadline of the routes """
+
+    def test_login_has_no_deadline(self):
+        deadlines = []
+
+        def authorize_check():
+            deadlines.append(util._get_deadline())  # pylint: disable=protected-access
+            return False
+
+        # The login keeps polling while the user enters the code, which usually takes longer than the deadline of a listing
+        with mock.patch('resources.lib.streamz.util.ROUTE_DEADLINE', 0), \
+                mock.patch('resources.lib.streamz.auth.Auth.authorize', return_value=dict(verification_uri='https://www.streamz.be/activate',
+                                                                                          user_code='ABCD', interval=0.2, expires_in=1)), \
+                mock.patch('resources.lib.streamz.auth.Auth.authorize_check', side_effect=authorize_check):
+            addon.run([routing.url_for(addon.show_login_menu), '0', ''])
+        self.assertGreater(len(deadlines), 1)
+        self.assertEqual(set(deadlines), {None})
+
+    def test_listing_has_deadline(self):
+        deadlines = []
+
+        def show_mylist():
+            deadlines.append(util._get_deadline())  # pylint: disable=protected-access
+
+        with mock.patch('resources.lib.modules.catalog.Catalog.__init__', return_value=None), \
+                mock.patch('resources.lib.modules.catalog.Catalog.show_mylist', side_effect=show_mylist):
+            addon.run([routing.url_for(addon.show_mylist), '0', ''])
+        self.assertIsNotNone(deadlines[0])
+        self.assertIsNone(util._get_deadline())  # pylint: disable=protected-access
+
+
 if __name__ == '__main__':
     unittest.main()
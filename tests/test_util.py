@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+""" Tests for the HTTP layer """
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from requests import HTTPError
+
+from resources.lib.streamz import API_ENDPOINT, VIDEOPLAYER_ENDPOINT, util
+from resources.lib.streamz.exceptions import InvalidTokenException, LimitReachedException, NetworkException, UnavailableException
+
+try:  # Python 3
+    from unittest import mock
+except ImportError:  # Python 2
+    import mock
+
+try:  # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    """ A local stand-in for the API that handles every request in its own thread """
+    daemon_threads = True
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """ Replies with the next scripted response of the requested path """
+
+    def _reply(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.command, self.path))
+            server.tokens.append(self.headers.get('lfvp-auth'))
+            script = server.scripts.get(self.path, [])
+            status, headers, delay = script.pop(0) if len(script) > 1 else script[0]
+
+        if delay:
+            time.sleep(delay)
+
+        body = b'{}'
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    do_GET = _reply
+    do_HEAD = _reply
+    do_POST = _reply
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+def reset_session():
+    """ Make sure the next request creates a new session, so it picks up the cassette configuration """
+    if hasattr(util.get_session, 'cached'):
+        del util.get_session.cached
+
+
+class TestUtil(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadedHTTPServer(('127.0.0.1', 0), ScriptedHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.tokens = []
+        self.server.scripts = {}
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+        # Keep the tests fast
+        self._defaults = util.RETRY_BACKOFF, util.TIMEOUT_READ
+        util.RETRY_BACKOFF = 0.01
+
+    def tearDown(self):
+        util.RETRY_BACKOFF, util.TIMEOUT_READ = self._defaults
+        util.set_token_refresher(None)
+        util._REFRESHED_TOKENS.clear()  # pylint: disable=protected-access
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retry_server_error(self):
+        self.server.scripts['/flaky'] = [(503, {}, 0), (502, {}, 0), (200, {}, 0)]
+        response = util.http_get(self.url + '/flaky')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_retry_gives_up(self):
+        self.server.scripts['/down'] = [(500, {}, 0)]
+        with self.assertRaises(HTTPError):
+            util.http_get(self.url + '/down')
+        self.assertEqual(len(self.server.requests), util.RETRY_TOTAL + 1)
+
+    def test_no_retry_post(self):
+        self.server.scripts['/post'] = [(503, {}, 0), (200, {}, 0)]
+        with self.assertRaises(HTTPError):
+            util.http_post(self.url + '/post', data={})
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_retry_after(self):
+        self.server.scripts['/limit'] = [(429, {'Retry-After': '1'}, 0), (200, {}, 0)]
+        start = time.time()
+        response = util.http_post(self.url + '/limit', data={})
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(time.time() - start, 1)
+
+        # Without a Retry-After header, a 429 means that we reached a limit
+        self.server.scripts['/streams'] = [(429, {}, 0)]
+        with self.assertRaises(LimitReachedException):
+            util.http_get(self.url + '/streams')
+
+    def test_retry_refused(self):
+        # A POST is retried when the connection could not be made, since the server can't have received it
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        url = 'http://127.0.0.1:%d/refused' % sock.getsockname()[1]
+        sock.close()
+        with mock.patch('resources.lib.streamz.util._get_backoff', wraps=util._get_backoff) as get_backoff, \
+                self.assertRaises(NetworkException):  # pylint: disable=protected-access
+            util.http_post(url, data={})
+        self.assertEqual(get_backoff.call_count, util.RETRY_TOTAL)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(util._parse_retry_after('120'), 120)  # pylint: disable=protected-access
+        self.assertIsNone(util._parse_retry_after('soon'))  # pylint: disable=protected-access
+        self.assertEqual(util._parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0)  # pylint: disable=protected-access
+
+    def test_timeout(self):
+        util.TIMEOUT_READ = 0.2
+        self.server.scripts['/slow'] = [(200, {}, 0.5), (200, {}, 0)]
+        response = util.http_get(self.url + '/slow')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_single_flight(self):
+        self.server.scripts['/shared'] = [(200, {}, 0.3)]
+        coalesced = util.get_coalesced_count()
+        responses = []
+
+        def worker():
+            responses.append(util.http_get(self.url + '/shared'))
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(responses), 5)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(util.get_coalesced_count() - coalesced, 4)
+
+        # Requests that are not in flight anymore are sent again
+        util.http_get(self.url + '/shared')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_get_many(self):
+        self.server.scripts['/first'] = [(200, {}, 0.2)]
+        self.server.scripts['/second'] = [(200, {}, 0)]
+        self.server.scripts['/missing'] = [(404, {}, 0)]
+
+        start = time.time()
+        responses = util.http_get_many([dict(url=self.url + path) for path in ['/first', '/missing', '/second', '/first']])
+        self.assertLess(time.time() - start, 0.4)
+
+        # The results are in the order of the requests, and errors are mapped like http_get does
+        self.assertEqual([response.url for response in responses if not isinstance(response, Exception)],
+                         [self.url + '/first', self.url + '/second', self.url + '/first'])
+        self.assertIsInstance(responses[1], UnavailableException)
+
+    def test_token_refresh(self):
+        refreshed = []
+
+        def refresher(token):
+            time.sleep(0.2)
+            refreshed.append(token)
+            return 'new'
+
+        util.set_token_refresher(refresher)
+        for index in range(5):
+            self.server.scripts['/private%d' % index] = [(401, {}, 0), (200, {}, 0)]
+
+        # A burst of rejected requests results in only one refresh, and every request is sent again with the new token
+        responses = util.http_get_many([dict(url=self.url + '/private%d' % index, token='old') for index in range(5)], max_workers=5)
+        self.assertEqual([response.status_code for response in responses], [200] * 5)
+        self.assertEqual(refreshed, ['old'])
+        self.assertEqual(sorted(self.server.tokens), ['new'] * 5 + ['old'] * 5)
+
+        # A token that is rejected later is refreshed too, but a token is only refreshed once
+        self.server.scripts['/denied'] = [(401, {}, 0)]
+        for _ in range(2):
+            with self.assertRaises(InvalidTokenException):
+                util.http_post(self.url + '/denied', data={}, token='expired')
+        self.assertEqual(refreshed, ['old', 'expired'])
+
+    def test_token_refresh_rejected(self):
+        refreshed = []
+
+        def refresher(token):
+            refreshed.append(token)
+            return token + '+'
+
+        # A request that is also rejected with the refreshed token is only sent again once
+        util.set_token_refresher(refresher)
+        self.server.scripts['/denied'] = [(401, {}, 0)]
+        with self.assertRaises(InvalidTokenException):
+            util.http_get(self.url + '/denied', token='old')
+        self.assertEqual(refreshed, ['old'])
+        self.assertEqual(self.server.tokens, ['old', 'old+'])
+
+    def test_connection_pools(self):
+        # Every host has its own pool
+        api_adapter = util.get_session().get_adapter(API_ENDPOINT + '/STREAMZ/detail/1')
+        self.assertIsNot(api_adapter, util.get_session().get_adapter(VIDEOPLAYER_ENDPOINT + '/config/heartbeat'))
+        self.assertIsNot(api_adapter, util.get_session().get_adapter('https://cdn.example.com/subtitles.vtt'))
+        self.assertEqual(api_adapter._pool_maxsize, util.POOL_MAXSIZE)  # pylint: disable=protected-access
+
+    def test_prewarm(self):
+        self.server.scripts['/'] = [(404, {}, 0)]
+        util.prewarm([self.url + '/'])
+        for thread in threading.enumerate():
+            if thread.name.startswith('prewarm-'):
+                thread.join()
+        self.assertEqual(self.server.requests, [('HEAD', '/')])
+
+    def test_format_body(self):
+        body = util._format_body(b'{"accessToken":"secret","name":"Tom","refresh_token":"abc","jwt":"eyJhbGciOi.eyJzdWIi.c2lnbmF0dXJl"}')  # pylint: disable=protected-access
+        self.assertEqual(body, '{"accessToken":"**redacted**","name":"Tom","refresh_token":"**redacted**","jwt":"**redacted**"}')
+
+        # Large bodies are capped
+        body = util._format_body(b'x' * (util.LOG_BODY_MAX + 100))  # pylint: disable=protected-access
+        self.assertTrue(body.endswith('... (100 more bytes)'))
+
+    def test_cassette(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        self.addCleanup(reset_session)
+        cassette = os.path.join(path, 'cassette.json')
+        self.server.scripts['/recorded'] = [(200, {'ETag': '"1"'}, 0.1)]
+
+        # Record a session
+        reset_session()
+        with mock.patch.dict(os.environ, {'ADDON_CASSETTE': cassette, 'ADDON_CASSETTE_MODE': 'record'}):
+            util.http_get(self.url + '/recorded')
+        self.assertEqual(len(self.server.requests), 1)
+
+        # Replay the session without the server, including the response time
+        self.server.shutdown()
+        reset_session()
+        with mock.patch.dict(os.environ, {'ADDON_CASSETTE': cassette, 'ADDON_CASSETTE_MODE': 'replay', 'ADDON_CASSETTE_REALTIME': '1'}):
+            start = time.time()
+            response = util.http_get(self.url + '/recorded')
+            self.assertGreaterEqual(time.time() - start, 0.1)
+            self.assertEqual(response.text, '{}')
+            self.assertEqual(util.get_validators(response), {'etag': '"1"'})
+
+            # Requests that were not recorded fail right away
+            with mock.patch('resources.lib.streamz.util._get_backoff', wraps=util._get_backoff) as get_backoff, \
+                    self.assertRaises(NetworkException):  # pylint: disable=protected-access
+                util.http_get(self.url + '/other')
+            self.assertEqual(get_backoff.call_count, 0)
+
+    def test_deadline(self):
+        self.server.scripts['/late'] = [(503, {'Retry-After': '2'}, 0), (200, {}, 0)]
+        with util.deadline(1), self.assertRaises(NetworkException):
+            util.http_get(self.url + '/late')
+        self.assertEqual(len(self.server.requests), 1)
+
+        # A shorter deadline can be set for a block of requests
+        self.server.scripts['/slow'] = [(200, {}, 2)]
+        start = time.time()
+        with util.deadline(5), util.deadline(0.5), self.assertRaises(NetworkException):
+            util.http_get(self.url + '/slow')
+        self.assertLess(time.time() - start, 1.5)
+
+        # The deadline only applies to the requests of the current thread, and ends with the block
+        responses = []
+        with util.deadline(0.1):
+            time.sleep(0.2)
+            thread = threading.Thread(target=lambda: responses.append(util.http_get(self.url + '/late')))
+            thread.start()
+            thread.join()
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertEqual(util.http_post(self.url + '/late', data={}).status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()